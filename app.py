@@ -2,19 +2,25 @@ import streamlit as st
 import pandas as pd
 from datetime import date, timedelta, datetime
 import db_manager as db
+import database_setup
+import disk_cache
 import plotly.express as px
 import plotly.graph_objects as go
-from main import run_data_update
+import sync_worker
+import main
+from period_index import PeriodIndex
+from sheet_reader import FORM_RESPONSES_WORKSHEET
 import auth_manager
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 import gspread
 import time
+import os
 import locale
 import base64
 
-# Import the new PDF reporter class
-from pdf_reporter import PDFReporter
+# pdf_reporter (fpdf, PIL, arabic_reshaper, bidi, kaleido) and googleapiclient
+# (see auth_manager.get_forms_service) are imported where they are first
+# needed, so a cold start or a plain page view does not pay for the PDF stack
+# and the API discovery client.
 
 # --- Page Configuration and RTL CSS Injection ---
 st.set_page_config(page_title="ماراثون القراءة", page_icon="📚", layout="wide")
@@ -124,6 +130,7 @@ def create_activity_heatmap(df, start_date, end_date, title_text=''):
 
 # --- Helper function to update Google Form ---
 def update_form_members(forms_service, form_id, question_id, active_member_names):
+    from googleapiclient.errors import HttpError
     if not form_id or not question_id:
         st.error("لم يتم العثور على معرّف النموذج أو معرّف سؤال الأعضاء في الإعدادات.")
         return False
@@ -161,22 +168,15 @@ def update_form_members(forms_service, form_id, question_id, active_member_names
         return False
 
 # --- FINALIZED: Helper function for Dynamic Headline (Overall Dashboard) ---
-def generate_headline(logs_df, achievements_df, members_df):
-    if 'common_book_minutes' in logs_df.columns and 'other_book_minutes' in logs_df.columns:
-        logs_df['total_minutes'] = logs_df['common_book_minutes'] + logs_df['other_book_minutes']
-    else:
-        return "صفحة جديدة في ماراثوننا، الأسبوع الأول هو صفحة بيضاء، حان وقت تدوين الإنجازات"
-
+def generate_headline(members_df):
+    # The 7-day windows are range queries on the indexed ISO dates, not full-frame filters
     today = date.today()
     last_7_days_start = today - timedelta(days=6)
     prev_7_days_start = today - timedelta(days=13)
     prev_7_days_end = today - timedelta(days=7)
 
-    last_7_days_logs = logs_df[logs_df['submission_date_dt'] >= last_7_days_start]
-    prev_7_days_logs = logs_df[(logs_df['submission_date_dt'] >= prev_7_days_start) & (logs_df['submission_date_dt'] <= prev_7_days_end)]
-    
-    last_7_total_minutes = last_7_days_logs['total_minutes'].sum()
-    prev_7_total_minutes = prev_7_days_logs['total_minutes'].sum()
+    last_7_total_minutes = db.get_reading_minutes_between(last_7_days_start, today)
+    prev_7_total_minutes = db.get_reading_minutes_between(prev_7_days_start, prev_7_days_end)
 
     momentum_available = prev_7_total_minutes > 0
     momentum_positive = None
@@ -185,12 +185,11 @@ def generate_headline(logs_df, achievements_df, members_df):
         percentage_change = ((last_7_total_minutes - prev_7_total_minutes) / prev_7_total_minutes) * 100
         momentum_positive = percentage_change >= 0
 
-    recent_achievements = achievements_df[achievements_df['achievement_date_dt'] >= last_7_days_start]
-    book_finishers = recent_achievements[recent_achievements['achievement_type'].isin(['FINISHED_COMMON_BOOK', 'FINISHED_OTHER_BOOK'])]
+    book_finishers = db.get_achievements_between(last_7_days_start, today, ['FINISHED_COMMON_BOOK', 'FINISHED_OTHER_BOOK'])
     
     recent_finishers_names = []
-    if not book_finishers.empty:
-        finisher_ids = book_finishers['member_id'].unique()
+    if book_finishers:
+        finisher_ids = list({a['member_id'] for a in book_finishers})
         recent_finishers_names = members_df[members_df['member_id'].isin(finisher_ids)]['name'].tolist()
 
     achievement_available = len(recent_finishers_names) > 0
@@ -305,10 +304,120 @@ def generate_challenge_headline(podium_df, period_achievements_df, members_df, e
     style = "background-color: #eaf2f8; padding: 15px; border-radius: 10px; text-align: center; font-size: 1.1em; color: #1c2833;"
     return f"<div style='{style}'>{final_text}</div>"
     
+# --- Helper function for the Smart Record Editor ---
+def load_editor_data(df):
+    """Adds the checkbox columns to a sheet-shaped frame and puts it in the editor's session state."""
+    df = df.copy()
+    ACHIEVEMENT_OPTIONS = {
+        'ach_finish_common': 'أنهيت الكتاب المشترك',
+        'ach_finish_other': 'أنهيت كتاباً آخر',
+        'ach_attend_discussion': 'حضرت جلسة النقاش'
+    }
+    QUOTE_OPTIONS = {
+        'quote_common': 'أرسلت اقتباساً من الكتاب المشترك',
+        'quote_other': 'أرسلت اقتباساً من كتاب آخر'
+    }
+
+    achievements_col_name = next((col for col in df.columns if 'إنجازات الكتب والنقاش' in col), None)
+    quotes_col_name = next((col for col in df.columns if 'الاقتباسات التي أرسلتها' in col), None)
+
+    if achievements_col_name:
+        df[achievements_col_name] = df[achievements_col_name].astype(str)
+        for key, text in ACHIEVEMENT_OPTIONS.items():
+            df[key] = df[achievements_col_name].str.contains(text, na=False)
+    
+    if quotes_col_name:
+        df[quotes_col_name] = df[quotes_col_name].astype(str)
+        for key, text in QUOTE_OPTIONS.items():
+            df[key] = df[quotes_col_name].str.contains(text, na=False)
+    
+    st.session_state.editor_data = df
+    st.session_state.original_editor_data = df.copy()
+
+def rows_moved_since_snapshot(worksheet, timestamp_col_idx, rows):
+    """
+    Reads back the Timestamp cell of each editor row's sheet_row_index in one
+    batch_get and returns the Timestamps no longer found there: rows inserted,
+    deleted or sorted in the sheet since the snapshot the editor opened from.
+    """
+    value_ranges = worksheet.batch_get([gspread.utils.rowcol_to_a1(int(row_index), timestamp_col_idx) for row_index in rows['sheet_row_index']])
+    current = [values[0][0] if values and values[0] else '' for values in value_ranges]
+    return [timestamp for timestamp, found in zip(rows['Timestamp'], current) if str(found).strip() != str(timestamp).strip()]
+
+# --- Cached Data Access ---
+# Keyed on the DB data generation: every write in db_manager bumps it, so
+# reruns (widget interactions, page switches) reuse the prepared frames until
+# the data actually changes.
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_dashboard_data(data_generation):
+    all_data = db.get_all_data_for_stats() or {}
+    members_df = pd.DataFrame(all_data.get('members', []))
+    periods_df = pd.DataFrame(all_data.get('periods', []))
+
+    logs_df = pd.DataFrame(all_data.get('logs', []))
+    if not logs_df.empty:
+        datetime_series = pd.to_datetime(logs_df['submission_date'], format='%Y-%m-%d', errors='coerce')
+        logs_df['submission_date_dt'] = datetime_series.dt.date
+        logs_df['weekday_name'] = datetime_series.dt.strftime('%A')
+        logs_df['total_minutes'] = logs_df['common_book_minutes'] + logs_df['other_book_minutes']
+
+    achievements_df = pd.DataFrame(all_data.get('achievements', []))
+    if not achievements_df.empty:
+        achievements_df['achievement_date_dt'] = pd.to_datetime(achievements_df['achievement_date'], errors='coerce').dt.date
+
+    member_stats_df = db.get_table_as_df('MemberStats')
+    if not member_stats_df.empty and not members_df.empty:
+        member_stats_df = pd.merge(member_stats_df, members_df[['member_id', 'name']], on='member_id', how='left')
+    group_stats_df = db.get_table_as_df('GroupStats')
+
+    return {
+        "members_df": members_df, "periods_df": periods_df, "logs_df": logs_df,
+        "achievements_df": achievements_df, "member_stats_df": member_stats_df,
+        "group_stats_df": group_stats_df
+    }
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def load_member_period_stats(period_id, data_generation):
+    return db.get_member_period_stats(period_id)
+
+def member_period_stats_from_logs(period, period_logs_df, period_achievements_df, members_df):
+    """
+    The MemberPeriodStats rows of one challenge, computed by the stats engine
+    from its logs, for a challenge it has not filled in yet (no sync since it
+    was added).
+    """
+    rules_df = pd.DataFrame([period], columns=['period_id'] + main.RULE_COLUMNS).set_index('period_id')
+    logs_df = main.prepare_logs_frame(period_logs_df, PeriodIndex([period]), rules_df)
+    achievements_df = main.prepare_achievements_frame(period_achievements_df, rules_df)
+    stats_df = main.compute_member_period_stats(logs_df, achievements_df, rules_df)
+    stats_df = stats_df.merge(members_df[['member_id', 'name']], on='member_id')
+    return stats_df.sort_values('name').reset_index(drop=True)
+
+# --- Cached PDF Reports ---
+# Finished report bytes on disk, shared by every session and server process.
+# A report only changes when the data does (data generation) or the day does
+# (the cover shows the export date and some pages count days up to today).
+# Reports of older generations are never asked for again, so the LRU cap
+# evicts them first.
+REPORT_CACHE = disk_cache.DiskLRUCache(os.path.join(db.DB_FOLDER, 'report_cache'), max_bytes=100 * 1024 * 1024, suffix='.pdf')
+
+def report_cache_key(report_type, data_generation, period_id=None):
+    # The generation the page was rendered from, not the current one: a sync
+    # finishing mid-run must not file this run's figures under newer data
+    return f"{report_type}_{period_id or 'all'}_g{data_generation}_{date.today()}"
+
+# --- Schema Migrations ---
+# Once per server process: creates the database on first run and applies any
+# pending migrations (indexes, backfills) to an existing one in place.
+@st.cache_resource(show_spinner="جاري تحديث بنية قاعدة البيانات...")
+def ensure_database_schema():
+    return database_setup.create_database()
+
+ensure_database_schema()
+
 # --- Main App Authentication and Setup ---
 creds = auth_manager.authenticate()
 gc = auth_manager.get_gspread_client()
-forms_service = build('forms', 'v1', credentials=creds)
 
 spreadsheet_url = db.get_setting("spreadsheet_url")
 form_url = db.get_setting("form_url")
@@ -353,6 +462,7 @@ if not form_url:
                     sheet_title = gc.open_by_url(spreadsheet_url).title
                     member_names = members_df_for_form['name'].tolist()
                     new_form_info = {"info": {"title": sheet_title, "documentTitle": sheet_title}}
+                    forms_service = auth_manager.get_forms_service(creds)
                     form_result = forms_service.forms().create(body=new_form_info).execute()
                     form_id = form_result['formId']
                     date_options = generate_date_options()
@@ -397,21 +507,53 @@ if not form_url:
     st.stop()
 
 # --- Main Application Logic ---
-all_data = db.get_all_data_for_stats()
-members_df = pd.DataFrame(all_data.get('members', []))
-periods_df = pd.DataFrame(all_data.get('periods', []))
+data_generation = db.get_data_generation()
+dashboard_data = load_dashboard_data(data_generation)
+members_df = dashboard_data['members_df']
+periods_df = dashboard_data['periods_df']
 setup_complete = not periods_df.empty
 
 st.sidebar.title("لوحة التحكم")
 st.sidebar.success(f"أهلاً بك! (تم تسجيل الدخول)")
+full_resync = st.sidebar.checkbox("♻️ مزامنة كاملة (إعادة بناء جميع السجلات)", key="full_resync", help="افتراضياً تتم مزامنة الصفوف الجديدة فقط منذ آخر تحديث.")
 if st.sidebar.button("🔄 تحديث وسحب البيانات", type="primary", use_container_width=True):
-    with st.spinner("جاري سحب البيانات..."):
-        update_log = run_data_update(gc)
-        st.session_state['update_log'] = update_log
-        # Clear editor state after a full sync
+    # The sync runs on a background thread; the dashboards stay usable meanwhile
+    if sync_worker.start_sync(gc, full_resync=full_resync) is None:
+        st.sidebar.warning("⏳ توجد عملية مزامنة جارية بالفعل، يرجى الانتظار حتى تنتهي.")
+
+# --- Sync Progress (polled while a background sync is running) ---
+current_sync_job = sync_worker.get_current_job()
+sync_running = current_sync_job is not None and current_sync_job.status == 'running'
+if current_sync_job is not None and 'sync_job_seen' not in st.session_state and not sync_running:
+    # A sync that finished before this session started is not reported again
+    st.session_state['sync_job_seen'] = current_sync_job.job_id
+
+@st.fragment(run_every=1.0 if sync_running else None)
+def sync_progress_panel():
+    job = sync_worker.get_current_job()
+    if job is None:
+        return
+    state = job.snapshot()
+    if state['status'] == 'running':
+        with st.status("🔄 جاري المزامنة في الخلفية...", expanded=True):
+            for elapsed, message in state['lines'][-8:]:
+                st.text(f"[{elapsed:6.1f}s] {message.strip()}")
+    elif st.session_state.get('sync_job_seen') != state['job_id']:
+        # Finished: reload the whole page once so every view reads the new data
+        st.session_state['sync_job_seen'] = state['job_id']
+        st.session_state['update_log'] = [f"[{elapsed:6.1f}s] {message}" for elapsed, message in state['lines']]
+        if state['error']:
+            st.session_state['update_log'].append(f"❌ فشلت المزامنة: {state['error']}")
+        # Clear editor state after a sync
         if 'editor_data' in st.session_state:
             del st.session_state['editor_data']
-    st.rerun()
+        st.rerun()
+
+with st.sidebar:
+    sync_progress_panel()
+    if not sync_running and sync_worker.is_sync_running():
+        # Started elsewhere: another server process or `python -m main sync`
+        st.info("⏳ توجد عملية مزامنة جارية من مصدر آخر، ستظهر البيانات الجديدة بعد انتهائها.")
 if 'update_log' in st.session_state:
     st.info("اكتملت عملية المزامنة.")
     with st.expander("عرض تفاصيل سجل التحديث الأخير"):
@@ -455,21 +597,11 @@ st.sidebar.title("التنقل")
 page_options = ["📈 لوحة التحكم العامة", "🎯 تحليلات التحديات", "⚙️ الإدارة والإعدادات"]
 page = st.sidebar.radio("اختر صفحة لعرضها:", page_options, key="navigation")
 
-# Load dataframes once
-logs_df = pd.DataFrame(all_data.get('logs', []))
-if not logs_df.empty:
-    datetime_series = pd.to_datetime(logs_df['submission_date'], format='%d/%m/%Y', errors='coerce')
-    logs_df['submission_date_dt'] = datetime_series.dt.date
-    logs_df['weekday_name'] = datetime_series.dt.strftime('%A')
-    logs_df['total_minutes'] = logs_df['common_book_minutes'] + logs_df['other_book_minutes']
-
-achievements_df = pd.DataFrame(all_data.get('achievements', []))
-if not achievements_df.empty:
-    achievements_df['achievement_date_dt'] = pd.to_datetime(achievements_df['achievement_date'], errors='coerce').dt.date
-    
-member_stats_df = db.get_table_as_df('MemberStats')
-if not member_stats_df.empty and not members_df.empty:
-    member_stats_df = pd.merge(member_stats_df, members_df[['member_id', 'name']], on='member_id', how='left')
+# Load dataframes once (served from the cache until the data generation changes)
+logs_df = dashboard_data['logs_df']
+achievements_df = dashboard_data['achievements_df']
+member_stats_df = dashboard_data['member_stats_df']
+group_stats_df = dashboard_data['group_stats_df']
 
 # --- Page Content ---
 if page == "📈 لوحة التحكم العامة":
@@ -502,7 +634,7 @@ if page == "📈 لوحة التحكم العامة":
     
     st.markdown("---")
     if not logs_df.empty and not achievements_df.empty and not members_df.empty:
-        headline_html = generate_headline(logs_df.copy(), achievements_df.copy(), members_df.copy())
+        headline_html = generate_headline(members_df)
         st.markdown(f"<div style='background-color: #f0f2f6; padding: 15px; border-radius: 10px; text-align: center; font-size: 1.1em; color: #1c2833;'>{headline_html}</div>", unsafe_allow_html=True)
     else:
         st.markdown("<div style='background-color: #f0f2f6; padding: 15px; border-radius: 10px; text-align: center; font-size: 1.1em; color: #1c2833;'>انطلق الماراثون! أهلاً بكم</div>", unsafe_allow_html=True)
@@ -644,33 +776,38 @@ if page == "📈 لوحة التحكم العامة":
         
         if st.button("🚀 إنشاء وتصدير تقرير لوحة التحكم", use_container_width=True, type="primary"):
             with st.spinner("جاري إنشاء التقرير..."):
-                pdf = PDFReporter()
+                report_key = report_cache_key('dashboard', data_generation)
+                pdf_output = REPORT_CACHE.get(report_key)
+                if pdf_output is None:
+                    from pdf_reporter import PDFReporter
+                    pdf = PDFReporter()
                 
-                # تم حذف الأسطر القديمة لإنشاء الغلاف والفهرس
-                # لأن دالة add_dashboard_report تقوم بكل شيء الآن
-
-                champions_data = {}
-                if king_of_reading is not None: champions_data["👑 ملك القراءة"] = king_of_reading['name']
-                if king_of_points is not None: champions_data["⭐ ملك النقاط"] = king_of_points['name']
-                if king_of_books is not None: champions_data["📚 ملك الكتب"] = king_of_books['name']
-                if king_of_quotes is not None: champions_data["✍️ ملك الاقتباسات"] = king_of_quotes['name']
+                    # تم حذف الأسطر القديمة لإنشاء الغلاف والفهرس
+                    # لأن دالة add_dashboard_report تقوم بكل شيء الآن
+
+                    champions_data = {}
+                    if king_of_reading is not None: champions_data["👑 ملك القراءة"] = king_of_reading['name']
+                    if king_of_points is not None: champions_data["⭐ ملك النقاط"] = king_of_points['name']
+                    if king_of_books is not None: champions_data["📚 ملك الكتب"] = king_of_books['name']
+                    if king_of_quotes is not None: champions_data["✍️ ملك الاقتباسات"] = king_of_quotes['name']
                 
-                dashboard_data = {
-                    "kpis_main": kpis_main,
-                    "kpis_secondary": kpis_secondary,
-                    "champions_data": champions_data,
-                    "fig_growth": fig_growth,
-                    "fig_donut": fig_donut,
-                    "fig_bar_days": fig_bar_days,
-                    "fig_points_leaderboard": fig_points_leaderboard,
-                    "fig_hours_leaderboard": fig_hours_leaderboard,
-                    # --- الإضافة الجديدة هنا ---
-                    "group_stats": group_stats_for_pdf, # تمرير إحصائيات المجموعة
-                    "periods_df": periods_df           # تمرير بيانات التحديات
-                }
-                pdf.add_dashboard_report(dashboard_data)
+                    report_data = {
+                        "kpis_main": kpis_main,
+                        "kpis_secondary": kpis_secondary,
+                        "champions_data": champions_data,
+                        "fig_growth": fig_growth,
+                        "fig_donut": fig_donut,
+                        "fig_bar_days": fig_bar_days,
+                        "fig_points_leaderboard": fig_points_leaderboard,
+                        "fig_hours_leaderboard": fig_hours_leaderboard,
+                        # --- الإضافة الجديدة هنا ---
+                        "group_stats": group_stats_for_pdf, # تمرير إحصائيات المجموعة
+                        "periods_df": periods_df           # تمرير بيانات التحديات
+                    }
+                    pdf.add_dashboard_report(report_data)
 
-                pdf_output = bytes(pdf.output())
+                    pdf_output = bytes(pdf.output())
+                    REPORT_CACHE.put(report_key, pdf_output)
                 st.session_state.pdf_file = pdf_output
                 st.rerun()
 
@@ -752,47 +889,20 @@ elif page == "🎯 تحليلات التحديات":
 
         podium_df = pd.DataFrame()
         all_participants_names = []
+        member_period_stats_df = load_member_period_stats(selected_period_id, data_generation)
+        if not period_logs_df.empty and member_period_stats_df.empty:
+            member_period_stats_df = member_period_stats_from_logs(selected_challenge_data, period_logs_df, period_achievements_df, members_df)
         if not period_logs_df.empty:
-            period_participants_ids = period_logs_df['member_id'].unique()
-            period_members_df = members_df[members_df['member_id'].isin(period_participants_ids)]
-            all_participants_names = period_members_df['name'].tolist()
-
-            podium_data = []
-            period_rules = selected_challenge_data
-
-            for _, member in period_members_df.iterrows():
-                member_id = member['member_id']
-                member_logs = period_logs_df[period_logs_df['member_id'] == member_id]
-                member_achievements = pd.DataFrame()
-                if not period_achievements_df.empty:
-                    member_achievements = period_achievements_df[period_achievements_df['member_id'] == member_id]
-
-                points = 0
-                common_minutes, other_minutes, common_quotes, other_quotes = 0, 0, 0, 0
-                if not member_logs.empty:
-                    common_minutes = member_logs['common_book_minutes'].sum()
-                    other_minutes = member_logs['other_book_minutes'].sum()
-                    common_quotes = member_logs['submitted_common_quote'].sum()
-                    other_quotes = member_logs['submitted_other_quote'].sum()
-
-                    if period_rules.get('minutes_per_point_common', 0) > 0: points += common_minutes // period_rules['minutes_per_point_common']
-                    if period_rules.get('minutes_per_point_other', 0) > 0: points += other_minutes // period_rules['minutes_per_point_other']
-                    points += common_quotes * period_rules.get('quote_common_book_points', 0)
-                    points += other_quotes * period_rules.get('quote_other_book_points', 0)
-                
-                if not member_achievements.empty:
-                    for _, ach in member_achievements.iterrows():
-                        ach_type = ach['achievement_type']
-                        if ach_type == 'FINISHED_COMMON_BOOK': points += period_rules.get('finish_common_book_points', 0)
-                        elif ach_type == 'ATTENDED_DISCUSSION': points += period_rules.get('attend_discussion_points', 0)
-                        elif ach_type == 'FINISHED_OTHER_BOOK': points += period_rules.get('finish_other_book_points', 0)
-
-                total_minutes = common_minutes + other_minutes
-                total_hours = total_minutes / 60
-                total_quotes = common_quotes + other_quotes
-
-                podium_data.append({'member_id': member_id, 'name': member['name'], 'points': int(points), 'hours': total_hours, 'quotes': int(total_quotes)})
-            podium_df = pd.DataFrame(podium_data)
+            # Points per member and source are materialized by the stats engine
+            member_period_stats_df = member_period_stats_df[member_period_stats_df['logs_count'] > 0]
+            all_participants_names = member_period_stats_df['name'].tolist()
+            podium_df = pd.DataFrame({
+                'member_id': member_period_stats_df['member_id'],
+                'name': member_period_stats_df['name'],
+                'points': member_period_stats_df['total_points'].astype(int),
+                'hours': (member_period_stats_df['minutes_common'] + member_period_stats_df['minutes_other']) / 60,
+                'quotes': (member_period_stats_df['quotes_common'] + member_period_stats_df['quotes_other']).astype(int),
+            }).reset_index(drop=True)
 
         # --- Variables for PDF Report ---
         fig_gauge, fig_area, heatmap_fig, fig_hours, fig_points = None, None, None, None, None
@@ -825,11 +935,19 @@ elif page == "🎯 تحليلات التحديات":
 
                 with col2:
                     st.subheader("مؤشرات الأداء الرئيسية")
-                    total_period_minutes = period_logs_df['total_minutes'].sum()
+                    period_group_stats = group_stats_df[group_stats_df['period_id'] == selected_period_id] if not group_stats_df.empty else pd.DataFrame()
+                    if not period_group_stats.empty:
+                        # Precomputed by the stats engine on every sync
+                        group_stats_row = period_group_stats.iloc[0]
+                        total_period_minutes = int(group_stats_row['total_group_minutes_common'] + group_stats_row['total_group_minutes_other'])
+                        active_participants = int(group_stats_row['active_members'])
+                        total_period_quotes = int(group_stats_row['total_group_quotes_common'] + group_stats_row['total_group_quotes_other'])
+                    else:
+                        total_period_minutes = period_logs_df['total_minutes'].sum()
+                        active_participants = period_logs_df['member_id'].nunique()
+                        total_period_quotes = period_logs_df['submitted_common_quote'].sum() + period_logs_df['submitted_other_quote'].sum()
                     total_period_hours = int(total_period_minutes // 60)
-                    active_participants = period_logs_df['member_id'].nunique()
                     avg_daily_reading = (total_period_minutes / days_passed / active_participants) if days_passed > 0 and active_participants > 0 else 0
-                    total_period_quotes = period_logs_df['submitted_common_quote'].sum() + period_logs_df['submitted_other_quote'].sum()
 
                     kpi1, kpi2 = st.columns(2)
                     kpi1.metric("⏳ مجموع ساعات القراءة", f"{total_period_hours:,}")
@@ -935,22 +1053,17 @@ elif page == "🎯 تحليلات التحديات":
                         st.plotly_chart(individual_heatmap, use_container_width=True, key="individual_heatmap")
                     with col5:
                         st.subheader("مصادر النقاط")
-                        period_rules = selected_challenge_data
-                        points_source = {}
-                        common_minutes = member_logs['common_book_minutes'].sum()
-                        other_minutes = member_logs['other_book_minutes'].sum()
-                        if period_rules.get('minutes_per_point_common', 0) > 0: points_source['قراءة الكتاب المشترك'] = (common_minutes // period_rules['minutes_per_point_common'])
-                        if period_rules.get('minutes_per_point_other', 0) > 0: points_source['قراءة كتب أخرى'] = (other_minutes // period_rules['minutes_per_point_other'])
-                        common_quotes = member_logs['submitted_common_quote'].sum()
-                        other_quotes = member_logs['submitted_other_quote'].sum()
-                        points_source['اقتباسات (الكتاب المشترك)'] = common_quotes * period_rules.get('quote_common_book_points', 0)
-                        points_source['اقتباسات (كتب أخرى)'] = other_quotes * period_rules.get('quote_other_book_points', 0)
-                        if not member_achievements.empty:
-                            for _, ach in member_achievements.iterrows():
-                                ach_type = ach['achievement_type']
-                                if ach_type == 'FINISHED_COMMON_BOOK': points_source['إنهاء الكتاب المشترك'] = points_source.get('إنهاء الكتاب المشترك', 0) + period_rules.get('finish_common_book_points', 0)
-                                elif ach_type == 'ATTENDED_DISCUSSION': points_source['حضور النقاش'] = points_source.get('حضور النقاش', 0) + period_rules.get('attend_discussion_points', 0)
-                                elif ach_type == 'FINISHED_OTHER_BOOK': points_source['إنهاء كتب أخرى'] = points_source.get('إنهاء كتب أخرى', 0) + period_rules.get('finish_other_book_points', 0)
+                        member_period_row = member_period_stats_df[member_period_stats_df['member_id'] == member_id].iloc[0]
+                        points_source_columns = {
+                            'قراءة الكتاب المشترك': 'points_common_minutes',
+                            'قراءة كتب أخرى': 'points_other_minutes',
+                            'اقتباسات (الكتاب المشترك)': 'points_common_quotes',
+                            'اقتباسات (كتب أخرى)': 'points_other_quotes',
+                            'إنهاء الكتاب المشترك': 'points_finish_common',
+                            'حضور النقاش': 'points_attend',
+                            'إنهاء كتب أخرى': 'points_finish_other'
+                        }
+                        points_source = {label: int(member_period_row[col]) for label, col in points_source_columns.items()}
                         points_source_filtered = {k: v for k, v in points_source.items() if v > 0}
                         if points_source_filtered:
                             # تعريف لوحة ألوان ثابتة ومميزة لضمان تناسق الألوان
@@ -1001,42 +1114,47 @@ elif page == "🎯 تحليلات التحديات":
             else:
                 if st.button("🚀 إنشاء وتصدير تقرير التحدي", key="export_challenge_pdf", use_container_width=True, type="primary"):
                     with st.spinner("جاري إنشاء تقرير التحدي..."):
-                        pdf = PDFReporter()
-                        # pdf.add_cover_page()
+                        report_key = report_cache_key('challenge', data_generation, selected_period_id)
+                        pdf_output = REPORT_CACHE.get(report_key)
+                        if pdf_output is None:
+                            from pdf_reporter import PDFReporter
+                            pdf = PDFReporter()
+                            # pdf.add_cover_page()
                         
-                        challenge_duration = (end_date_obj - start_date_obj).days
-                        challenge_period_str = f"{start_date_obj.strftime('%Y-%m-%d')} إلى {end_date_obj.strftime('%Y-%m-%d')}"
+                            challenge_duration = (end_date_obj - start_date_obj).days
+                            challenge_period_str = f"{start_date_obj.strftime('%Y-%m-%d')} إلى {end_date_obj.strftime('%Y-%m-%d')}"
                         
-                        if not period_achievements_df.empty:
-                            finisher_ids = period_achievements_df[period_achievements_df['achievement_type'] == 'FINISHED_COMMON_BOOK']['member_id'].unique()
-                            attendee_ids = period_achievements_df[period_achievements_df['achievement_type'] == 'ATTENDED_DISCUSSION']['member_id'].unique()
-                            finishers_names = members_df[members_df['member_id'].isin(finisher_ids)]['name'].tolist()
-                            attendees_names = members_df[members_df['member_id'].isin(attendee_ids)]['name'].tolist()
+                            if not period_achievements_df.empty:
+                                finisher_ids = period_achievements_df[period_achievements_df['achievement_type'] == 'FINISHED_COMMON_BOOK']['member_id'].unique()
+                                attendee_ids = period_achievements_df[period_achievements_df['achievement_type'] == 'ATTENDED_DISCUSSION']['member_id'].unique()
+                                finishers_names = members_df[members_df['member_id'].isin(finisher_ids)]['name'].tolist()
+                                attendees_names = members_df[members_df['member_id'].isin(attendee_ids)]['name'].tolist()
                         
-                        challenge_kpis = {
-                            "⏳ مجموع ساعات القراءة": f"{total_period_hours:,}",
-                            "👥 المشاركون الفعليون": f"{active_participants}",
-                            "✍️ الاقتباسات المرسلة": f"{total_period_quotes}",
-                            "📊 متوسط القراءة اليومي/عضو": f"{avg_daily_reading:.1f} د"
-                        }
+                            challenge_kpis = {
+                                "⏳ مجموع ساعات القراءة": f"{total_period_hours:,}",
+                                "👥 المشاركون الفعليون": f"{active_participants}",
+                                "✍️ الاقتباسات المرسلة": f"{total_period_quotes}",
+                                "📊 متوسط القراءة اليومي/عضو": f"{avg_daily_reading:.1f} د"
+                            }
 
-                        challenge_data_for_pdf = {
-                            "title": selected_challenge_data.get('title', ''),
-                            "author": selected_challenge_data.get('author', ''),
-                            "period": challenge_period_str,
-                            "duration": challenge_duration,
-                            "all_participants": all_participants_names,
-                            "finishers": finishers_names,
-                            "attendees": attendees_names,
-                            "kpis": challenge_kpis,
-                            "fig_area": fig_area,
-                            "fig_hours": fig_hours,
-                            "fig_points": fig_points
-                        }
+                            challenge_data_for_pdf = {
+                                "title": selected_challenge_data.get('title', ''),
+                                "author": selected_challenge_data.get('author', ''),
+                                "period": challenge_period_str,
+                                "duration": challenge_duration,
+                                "all_participants": all_participants_names,
+                                "finishers": finishers_names,
+                                "attendees": attendees_names,
+                                "kpis": challenge_kpis,
+                                "fig_area": fig_area,
+                                "fig_hours": fig_hours,
+                                "fig_points": fig_points
+                            }
                         
-                        pdf.add_challenge_report(challenge_data_for_pdf)
+                            pdf.add_challenge_report(challenge_data_for_pdf)
                         
-                        pdf_output = bytes(pdf.output())
+                            pdf_output = bytes(pdf.output())
+                            REPORT_CACHE.put(report_key, pdf_output)
                         st.session_state.pdf_file_challenge = pdf_output
                         st.rerun()
 
@@ -1075,7 +1193,7 @@ elif page == "⚙️ الإدارة والإعدادات":
                         active_members = all_members[all_members['is_active'] == 1]['name'].tolist()
                         form_id = db.get_setting('form_id')
                         question_id = db.get_setting('member_question_id')
-                        if update_form_members(forms_service, form_id, question_id, active_members):
+                        if update_form_members(auth_manager.get_forms_service(creds), form_id, question_id, active_members):
                             st.info("✅ تم تحديث نموذج جوجل بنجاح.")
                         st.rerun()
                     elif status_code == 'exists':
@@ -1100,7 +1218,7 @@ elif page == "⚙️ الإدارة والإعدادات":
                         updated_active_members = active_members_df[active_members_df['member_id'] != member['member_id']]['name'].tolist()
                         form_id = db.get_setting('form_id')
                         question_id = db.get_setting('member_question_id')
-                        if update_form_members(forms_service, form_id, question_id, updated_active_members):
+                        if update_form_members(auth_manager.get_forms_service(creds), form_id, question_id, updated_active_members):
                             st.success(f"تم تعطيل {member['name']} وإزالته من نموذج التسجيل.")
                         st.rerun()
         else:
@@ -1118,7 +1236,7 @@ elif page == "⚙️ الإدارة والإعدادات":
                         current_active_names.append(member['name'])
                         form_id = db.get_setting('form_id')
                         question_id = db.get_setting('member_question_id')
-                        if update_form_members(forms_service, form_id, question_id, current_active_names):
+                        if update_form_members(auth_manager.get_forms_service(creds), form_id, question_id, current_active_names):
                             st.success(f"تم إعادة تنشيط {member['name']} وإضافته إلى نموذج التسجيل.")
                         st.rerun()
         else:
@@ -1296,48 +1414,26 @@ elif page == "⚙️ الإدارة والإعدادات":
     
     with admin_tab3:
         st.header("📝 محرر السجلات الذكي")
-        st.info("لضمان تعديل أحدث البيانات، يرجى الضغط على الزر أدناه لسحب السجلات مباشرة من Google Sheet قبل البدء بالتعديل.")
+        st.info("يفتح المحرر مباشرة على النسخة المحلية من السجلات (آخر مزامنة). لضمان تعديل أحدث البيانات، اضغط على الزر أدناه لمزامنة السجلات مع Google Sheet قبل البدء بالتعديل.")
+
+        # Open instantly from the local snapshot of the sheet taken by the last sync
+        if 'editor_data' not in st.session_state:
+            snapshot_df = db.get_sheet_snapshot_frame()
+            if not snapshot_df.empty:
+                load_editor_data(snapshot_df)
 
         if st.button("⬇️ تحميل أحدث السجلات للتعديل", use_container_width=True):
             with st.spinner("جاري سحب أحدث البيانات من Google Sheet..."):
                 try:
-                    spreadsheet = gc.open_by_url(spreadsheet_url)
-                    worksheet = spreadsheet.worksheet("Form Responses 1")
-                    sheet_data = worksheet.get_all_records()
+                    if sync_worker.run_sync(gc, full_fetch=True) is None:
+                        st.warning("⏳ توجد عملية مزامنة جارية، سيتم فتح آخر نسخة محلية من السجلات.")
+                    df = db.get_sheet_snapshot_frame()
                     
-                    if not sheet_data:
+                    if df.empty:
                         st.warning("جدول البيانات فارغ. لا توجد سجلات لعرضها.")
                         st.stop()
 
-                    df = pd.DataFrame(sheet_data)
-                    df['sheet_row_index'] = df.index + 2 # Save the original row index for updating later
-
-                    # --- Pre-processing for Checkboxes ---
-                    ACHIEVEMENT_OPTIONS = {
-                        'ach_finish_common': 'أنهيت الكتاب المشترك',
-                        'ach_finish_other': 'أنهيت كتاباً آخر',
-                        'ach_attend_discussion': 'حضرت جلسة النقاش'
-                    }
-                    QUOTE_OPTIONS = {
-                        'quote_common': 'أرسلت اقتباساً من الكتاب المشترك',
-                        'quote_other': 'أرسلت اقتباساً من كتاب آخر'
-                    }
-
-                    achievements_col_name = next((col for col in df.columns if 'إنجازات الكتب والنقاش' in col), None)
-                    quotes_col_name = next((col for col in df.columns if 'الاقتباسات التي أرسلتها' in col), None)
-
-                    if achievements_col_name:
-                        df[achievements_col_name] = df[achievements_col_name].astype(str)
-                        for key, text in ACHIEVEMENT_OPTIONS.items():
-                            df[key] = df[achievements_col_name].str.contains(text, na=False)
-                    
-                    if quotes_col_name:
-                        df[quotes_col_name] = df[quotes_col_name].astype(str)
-                        for key, text in QUOTE_OPTIONS.items():
-                            df[key] = df[quotes_col_name].str.contains(text, na=False)
-                    
-                    st.session_state.editor_data = df
-                    st.session_state.original_editor_data = df.copy()
+                    load_editor_data(df)
                     st.rerun()
 
                 except Exception as e:
@@ -1380,7 +1476,7 @@ elif page == "⚙️ الإدارة والإعدادات":
                 with st.spinner("جاري حفظ التغييرات..."):
                     try:
                         spreadsheet = gc.open_by_url(spreadsheet_url)
-                        worksheet = spreadsheet.worksheet("Form Responses 1")
+                        worksheet = spreadsheet.worksheet(FORM_RESPONSES_WORKSHEET)
                         sheet_headers = worksheet.row_values(1)
 
                         achievements_col_idx = sheet_headers.index(achievements_col_name) + 1
@@ -1422,13 +1518,29 @@ elif page == "⚙️ الإدارة والإعدادات":
                                         batch_updates.append({'range': f'{gspread.utils.rowcol_to_a1(sheet_row_to_update, col_idx)}', 'values': [[str(edited_row[sheet_col])]]})
                             
                             if batch_updates:
+                                # The editor opened from the last sync's snapshot: writing by row
+                                # number is only safe while each row still holds the same response
+                                timestamp_col_idx = sheet_headers.index(timestamp_col_name) + 1
+                                moved = rows_moved_since_snapshot(worksheet, timestamp_col_idx, original_df.loc[changed_indices])
+                                if moved:
+                                    with st.spinner("جاري تحديث السجلات من Google Sheet..."):
+                                        sync_worker.run_sync(gc, full_fetch=True)
+                                    del st.session_state.editor_data
+                                    if 'original_editor_data' in st.session_state:
+                                        del st.session_state.original_editor_data
+                                    st.error(f"❌ لم يتم حفظ أي تعديل: تغيّر ترتيب {len(moved)} سجل في Google Sheet منذ آخر مزامنة. تم تحديث السجلات، يرجى إعادة التعديل.")
+                                    st.stop()
                                 worksheet.batch_update(batch_updates)
                                 updates_count = len(changed_indices)
                                 st.success(f"✅ تم تحديث {updates_count} سجل بنجاح في Google Sheet.")
                                 st.info("سيتم الآن إعادة مزامنة التطبيق بالكامل.")
                                 with st.spinner("جاري المزامنة الكاملة..."):
-                                    run_data_update(gc)
-                                st.success("🎉 اكتملت المزامنة!")
+                                    sync_log = sync_worker.run_sync(gc, full_fetch=True)
+                                if sync_log is None:
+                                    # The running sync may have read the sheet before this edit
+                                    st.warning("⏳ توجد عملية مزامنة جارية، يرجى تحديث البيانات بعد انتهائها لتطبيق التعديلات.")
+                                else:
+                                    st.success("🎉 اكتملت المزامنة!")
                             else:
                                 st.info("لم يتم العثور على أي تغييرات لحفظها.")
                         
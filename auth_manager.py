@@ -4,6 +4,7 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from google.auth.transport.requests import Request
 import os
+import hashlib
 
 # --- Configuration Constants ---
 
@@ -91,6 +92,24 @@ def save_credentials_to_file(creds):
         token.write(creds.to_json())
 
 
+def load_stored_credentials():
+    """
+    Loads the saved token for use outside Streamlit (e.g. the sync daemon),
+    refreshing and re-saving it if it has expired.
+    Returns None when there is no usable token; signing in to the app creates one.
+    """
+    if not os.path.exists(TOKEN_FILE):
+        return None
+    creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+    if creds.valid:
+        return creds
+    if creds.expired and creds.refresh_token:
+        creds.refresh(Request())
+        save_credentials_to_file(creds)
+        return creds
+    return None
+
+
 @st.cache_resource
 def get_gspread_client():
     """Uses authenticated credentials to create a gspread client."""
@@ -99,4 +118,29 @@ def get_gspread_client():
         # --- LINGUISTIC UPDATE ---
         st.error("🔒 **خطأ في المصادقة:** لم نتمكن من التحقق من صلاحيات الوصول. قد تكون هناك مشكلة في الاتصال أو أنك لم تمنح الصلاحيات اللازمة.")
         st.stop()
-    return gspread.authorize(creds)
\ No newline at end of file
+    return gspread.authorize(creds)
+
+
+def _credentials_key(creds):
+    """
+    Identifies the signed-in account for the cache key: the OAuth client plus
+    the account (or, when the token does not name it, its long-lived refresh
+    token). Never the access token, which changes on every refresh.
+    """
+    identity = f"{creds.client_id}:{getattr(creds, 'account', '') or creds.refresh_token or ''}"
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+# One client per signed-in account; the cap keeps re-authorizations from piling up
+@st.cache_resource(max_entries=4)
+def _build_forms_service(credentials_key, _creds):
+    # googleapiclient is only imported once a form is created or updated.
+    # The Forms v1 discovery document ships with google-api-python-client, so
+    # building the client parses the bundled file once and makes no request.
+    from googleapiclient.discovery import build
+    return build('forms', 'v1', credentials=_creds, static_discovery=True, cache_discovery=False)
+
+
+def get_forms_service(creds):
+    """The Google Forms API client for these credentials, built once and reused across reruns."""
+    return _build_forms_service(_credentials_key(creds), creds)
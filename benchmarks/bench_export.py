@@ -0,0 +1,119 @@
+"""
+PDF export cost of the dashboard and challenge reports, with synthetic charts.
+
+    python benchmarks/bench_export.py [--members 40] [--days 60] [--repeat 3]
+
+Counts the charts rasterized by Kaleido against the number of times page
+layout asks for a chart image: before charts were rendered once into a
+RenderedImage, every one of those requests was a separate render. Also counts
+the Kaleido batches (render_pngs calls): with plotly's batch image API each
+batch starts one browser, instead of one per chart. Then exports the last
+charts again, unchanged, to show the chart cache skipping Kaleido. The cache lives in a temporary folder, not in data/.
+Needs the app's requirements (plotly, kaleido, fpdf2, Pillow, ...).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import pdf_reporter
+from disk_cache import DiskLRUCache
+
+def make_figures(n_members, n_days, rng):
+    """Figures shaped like the ones app.py passes to the two reports."""
+    names = [f"عضو {i}" for i in range(1, n_members + 1)]
+    days = [date(2024, 1, 1) + timedelta(days=d) for d in range(n_days)]
+    daily = pd.DataFrame({'date': days, 'hours': [rng.uniform(5, 40) for _ in days]})
+    daily['cumulative'] = daily['hours'].cumsum()
+    members = pd.DataFrame({'name': names, 'hours': [rng.uniform(1, 80) for _ in names], 'points': [rng.randint(0, 300) for _ in names], 'days': [rng.randint(1, n_days) for _ in names]})
+    bar = lambda column: px.bar(members.nlargest(10, column), x=column, y='name', orientation='h')
+    return {
+        'fig_growth': px.line(daily, x='date', y='cumulative'),
+        'fig_donut': go.Figure(go.Pie(labels=['الكتاب المشترك', 'كتب أخرى'], values=[60, 40], hole=0.5)),
+        'fig_bar_days': px.bar(members, x='name', y='days'),
+        'fig_points_leaderboard': bar('points'),
+        'fig_hours_leaderboard': bar('hours'),
+        'fig_area': px.area(daily, x='date', y='cumulative'),
+        'fig_hours': bar('hours'),
+        'fig_points': bar('points'),
+    }
+
+def export_reports(figures, folder):
+    """Builds both reports into folder; returns the wall time in seconds."""
+    start = time.perf_counter()
+    pdf = pdf_reporter.PDFReporter()
+    pdf.add_dashboard_report({
+        **{key: figures[key] for key in pdf_reporter.DASHBOARD_FIGURES},
+        'group_stats': {'total': 40, 'active': 35, 'inactive': 5},
+        'periods_df': pd.DataFrame([{'title': 'كتاب', 'author': 'مؤلف', 'start_date': '2024-01-01', 'end_date': '2024-02-29'}]),
+        'kpis_main': {'ساعات القراءة': 1200, 'الكتب المنهاة': 30}, 'champions_data': {'👑 ملك القراءة': 'عضو 1'},
+    })
+    pdf.output(os.path.join(folder, 'dashboard.pdf'))
+    pdf = pdf_reporter.PDFReporter()
+    pdf.add_challenge_report({
+        **{key: figures[key] for key in pdf_reporter.CHALLENGE_FIGURES},
+        'title': 'كتاب', 'author': 'مؤلف', 'period': '2024-01-01 إلى 2024-02-29', 'duration': 59,
+        'all_participants': ['عضو 1', 'عضو 2'], 'finishers': ['عضو 1'], 'attendees': ['عضو 2'],
+        'kpis': {'ساعات القراءة': 300},
+    })
+    pdf.output(os.path.join(folder, 'challenge.pdf'))
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--members', type=int, default=40)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    os.chdir(ROOT)  # the font and the cover image are loaded from the project folder
+
+    counts = {'renders': 0, 'batches': 0, 'render_seconds': 0.0, 'image_requests': 0}
+    render_pngs = pdf_reporter.render_pngs
+    def counting_render_pngs(figs):
+        start = time.perf_counter()
+        try:
+            return render_pngs(figs)
+        finally:
+            counts['renders'] += len(figs)
+            counts['batches'] += 1
+            counts['render_seconds'] += time.perf_counter() - start
+    figure_image = pdf_reporter.PDFReporter._figure_image
+    def counting_figure_image(self, fig):
+        counts['image_requests'] += 1
+        return figure_image(self, fig)
+    pdf_reporter.render_pngs = counting_render_pngs
+    pdf_reporter.PDFReporter._figure_image = counting_figure_image
+
+    walls = []
+    with tempfile.TemporaryDirectory() as folder:
+        pdf_reporter.CHART_CACHE = DiskLRUCache(os.path.join(folder, 'chart_cache'), max_bytes=1 << 30, suffix='.png')
+        export_reports(make_figures(args.members, args.days, random.Random(-1)), folder)  # warm up Kaleido
+        for key in counts:
+            counts[key] = 0
+        for seed in range(args.repeat):
+            walls.append(export_reports(make_figures(args.members, args.days, random.Random(seed)), folder))
+        fresh_counts = dict(counts)
+        counts['renders'] = 0
+        cached_wall = export_reports(make_figures(args.members, args.days, random.Random(args.repeat - 1)), folder)
+        cached_renders = counts['renders']
+
+    n_figures = (len(pdf_reporter.DASHBOARD_FIGURES) + len(pdf_reporter.CHALLENGE_FIGURES)) * args.repeat
+    print(f"\n{args.repeat} exports of both reports ({n_figures} charts)")
+    print(f"{'chart image requests by layout':<36}{fresh_counts['image_requests']:>8}  (one render each before RenderedImage)")
+    print(f"{'Kaleido renders':<36}{fresh_counts['renders']:>8}  ({fresh_counts['renders'] / n_figures:.1f} per chart)")
+    print(f"{'Kaleido batches':<36}{fresh_counts['batches']:>8}  (batch image API: {hasattr(pdf_reporter.pio, 'write_images')})")
+    print(f"{'time inside Kaleido (summed)':<36}{fresh_counts['render_seconds']:>8.2f} s")
+    print(f"{'export wall time per run':<36}{sum(walls) / len(walls):>8.2f} s")
+    print(f"{'unchanged re-export: renders':<36}{cached_renders:>8}")
+    print(f"{'unchanged re-export: wall time':<36}{cached_wall:>8.2f} s")
+
+if __name__ == '__main__':
+    main()
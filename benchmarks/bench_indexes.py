@@ -0,0 +1,113 @@
+"""
+Query latency of the hot ReadingLogs/Achievements lookups before and after
+database_setup.create_indexes, on a synthetic database.
+
+    python benchmarks/bench_indexes.py [--logs 120000] [--members 60] [--repeat 200]
+
+Uses only the standard library; the database lives in a temporary folder.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database_setup
+
+ACHIEVEMENT_TYPES = ['FINISHED_COMMON_BOOK', 'FINISHED_OTHER_BOOK', 'ATTENDED_DISCUSSION', 'QUOTE_COMMON', 'QUOTE_OTHER']
+
+def build_database(folder, n_logs, n_members, n_periods=24):
+    """Creates the real schema, drops the secondary indexes and fills it with synthetic rows."""
+    database_setup.DB_FOLDER = folder
+    database_setup.DB_PATH = os.path.join(folder, 'bench.db')
+    database_setup.create_database()
+    conn = sqlite3.connect(database_setup.DB_PATH)
+    for name, _, _ in database_setup.SECONDARY_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+    rng = random.Random(42)
+    first_day = date(2023, 1, 1)
+    days = max(n_logs // n_members, 1) + 1
+    period_days = max(days // n_periods, 1)
+    conn.executemany("INSERT INTO Members (member_id, name) VALUES (?, ?)", [(i, f"member {i}") for i in range(1, n_members + 1)])
+    conn.execute("INSERT INTO Books (book_id, title) VALUES (1, 'bench')")
+    conn.executemany(
+        "INSERT INTO ChallengePeriods VALUES (?, ?, ?, 1, 10, 5, 50, 25, 3, 1, 25)",
+        [(p, str(first_day + timedelta(days=p * period_days)), str(first_day + timedelta(days=(p + 1) * period_days - 1))) for p in range(n_periods)],
+    )
+
+    logs, achievements = [], []
+    for i in range(n_logs):
+        day = first_day + timedelta(days=i // n_members)
+        member_id = i % n_members + 1
+        period_id = min((day - first_day).days // period_days, n_periods - 1)
+        logs.append((f"ts-{i}", member_id, day.isoformat(), rng.randint(0, 90), rng.randint(0, 60), rng.random() < 0.3, rng.random() < 0.2))
+        if rng.random() < 0.4:
+            achievements.append((member_id, period_id, rng.choice(ACHIEVEMENT_TYPES), str(day)))
+    conn.executemany("INSERT INTO ReadingLogs (timestamp, member_id, submission_date, common_book_minutes, other_book_minutes, submitted_common_quote, submitted_other_quote) VALUES (?, ?, ?, ?, ?, ?, ?)", logs)
+    conn.executemany("INSERT OR IGNORE INTO Achievements (member_id, period_id, achievement_type, achievement_date) VALUES (?, ?, ?, ?)", achievements)
+    conn.commit()
+    return conn, [(first_day + timedelta(days=d)).isoformat() for d in range(days)], n_periods
+
+def make_queries(dates, n_members, n_periods, rng):
+    """(label, sql, params factory) for each access path the app uses."""
+    return [
+        ("did_submit_quote_today",
+         "SELECT 1 FROM ReadingLogs WHERE member_id = ? AND submission_date = ? AND submitted_common_quote = 1",
+         lambda: (rng.randint(1, n_members), rng.choice(dates))),
+        ("has_achievement",
+         "SELECT 1 FROM Achievements WHERE member_id = ? AND achievement_type = ? AND period_id = ?",
+         lambda: (rng.randint(1, n_members), rng.choice(ACHIEVEMENT_TYPES), rng.randrange(n_periods))),
+        ("minutes on one day",
+         "SELECT SUM(common_book_minutes + other_book_minutes) FROM ReadingLogs WHERE submission_date = ?",
+         lambda: (rng.choice(dates),)),
+        ("minutes in a 7-day window",
+         "SELECT SUM(common_book_minutes + other_book_minutes) FROM ReadingLogs WHERE submission_date BETWEEN ? AND ?",
+         lambda: (lambda i: (dates[i], dates[i + 6]))(rng.randrange(len(dates) - 6))),
+        ("achievements of a challenge",
+         "SELECT member_id, achievement_type FROM Achievements WHERE period_id = ?",
+         lambda: (rng.randrange(n_periods),)),
+    ]
+
+def time_queries(conn, queries, repeat):
+    """Returns {label: (mean ms, query plan)}."""
+    results = {}
+    for label, sql, params in queries:
+        plan = "; ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params()))
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params()).fetchall()
+        results[label] = ((time.perf_counter() - start) * 1000 / repeat, plan)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logs', type=int, default=120_000)
+    parser.add_argument('--members', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        conn, dates, n_periods = build_database(folder, args.logs, args.members)
+        queries = make_queries(dates, args.members, n_periods, random.Random(7))
+        before = time_queries(conn, queries, args.repeat)
+        database_setup.create_indexes(conn.cursor())
+        conn.commit()
+        after = time_queries(conn, queries, args.repeat)
+        conn.close()
+
+    print(f"\n{args.logs} logs, {args.members} members, {args.repeat} runs per query\n")
+    print(f"{'query':<30}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    for label in before:
+        b, a = before[label][0], after[label][0]
+        print(f"{label:<30}{b:>14.3f}{a:>14.3f}{b / a if a else float('inf'):>9.0f}x")
+    print("\nQuery plans after indexing:")
+    for label, (_, plan) in after.items():
+        print(f"  {label}: {plan}")
+
+if __name__ == '__main__':
+    main()
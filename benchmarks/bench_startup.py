@@ -0,0 +1,85 @@
+"""
+Cold-start import cost of app.py, measured with `python -X importtime`.
+
+    python benchmarks/bench_startup.py [--repeat 5] [--top 15] [--deferred pdf_reporter googleapiclient.discovery]
+
+Each run is a fresh interpreter that executes only the top-level imports of
+app.py (the page itself needs a Streamlit server), so the numbers track what
+every cold start and every new Streamlit worker pays before the first render.
+The modules app.py imports lazily are then imported in the same process to
+show what the first PDF export or Google API call adds on top.
+"""
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKER = "--- deferred imports ---"
+
+def top_level_imports(script):
+    """The source of the import statements at the top of a script, up to its first other statement."""
+    with open(script, encoding='utf-8') as f:
+        source = f.read()
+    imports = []
+    for node in ast.parse(source).body:
+        if not isinstance(node, (ast.Import, ast.ImportFrom)):
+            break
+        imports.append(ast.get_source_segment(source, node))
+    return "\n".join(imports)
+
+def parse_importtime(stderr):
+    """{module: (self us, cumulative us, depth)} from -X importtime output, in import order."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the column header
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+def measure(imports, deferred):
+    """One fresh interpreter: returns (startup modules, deferred modules)."""
+    code = "\n".join([imports, f"import sys; sys.stderr.write({MARKER!r} + '\\n')"] + [f"import {name}" for name in deferred])
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"Importing app.py's modules failed:\n{result.stderr.strip().splitlines()[-1]}")
+    startup, _, after = result.stderr.partition(MARKER)
+    return parse_importtime(startup), parse_importtime(after)
+
+def total_ms(modules):
+    return sum(cumulative for _, cumulative, depth in modules.values() if depth == 0) / 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--script', default=os.path.join(ROOT, 'app.py'))
+    parser.add_argument('--deferred', nargs='*', default=['pdf_reporter', 'googleapiclient.discovery'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    imports = top_level_imports(args.script)
+    runs = [measure(imports, args.deferred) for _ in range(args.repeat)]
+    startup_totals = [total_ms(startup) for startup, _ in runs]
+    deferred_totals = [total_ms(deferred) for _, deferred in runs]
+    # The first run may still be warming the OS file cache; report the median
+    startup, deferred = runs[startup_totals.index(statistics.median_low(startup_totals))]
+
+    print(f"\n{os.path.basename(args.script)}: {len(startup)} modules imported at startup, median of {args.repeat} runs")
+    print(f"{'startup imports':<40}{statistics.median(startup_totals):>10.1f} ms")
+    print(f"{'deferred (' + ', '.join(args.deferred) + ')':<40}{statistics.median(deferred_totals):>10.1f} ms  ({len(deferred)} more modules)")
+    print("\nHeaviest imports at startup (top two levels):")
+    heaviest = sorted(((cumulative, name) for name, (_, cumulative, depth) in startup.items() if depth <= 1), reverse=True)
+    for cumulative, name in heaviest[:args.top]:
+        print(f"  {name:<38}{cumulative / 1000:>10.1f} ms")
+    eager = [name for name in args.deferred if name in startup]
+    if eager:
+        print(f"\nWarning: already imported at startup: {', '.join(eager)}")
+
+if __name__ == '__main__':
+    main()
@@ -5,17 +5,29 @@ DB_FOLDER = 'data'
 DB_NAME = 'reading_tracker.db'
 DB_PATH = os.path.join(DB_FOLDER, DB_NAME)
 
-def create_database():
-    """
-    Sets up or updates the database schema.
-    It creates all necessary tables for the application to function
-    and removes all penalty-related columns.
-    """
-    os.makedirs(DB_FOLDER, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    print(f"Database connection established. Building simplified schema (no penalties)...")
+# --- Secondary Indexes ---
+# (name, table, columns) for the hot read paths. The quote/achievement lookups
+# are fully covered by their index, so SQLite never touches the table rows.
+SECONDARY_INDEXES = [
+    # did_submit_quote_today: member_id + submission_date + quote flag
+    ("idx_logs_member_date", "ReadingLogs", "member_id, submission_date, submitted_common_quote, submitted_other_quote"),
+    # Challenge/date filtering and per-day aggregation of minutes
+    ("idx_logs_date", "ReadingLogs", "submission_date, member_id, common_book_minutes, other_book_minutes"),
+    # has_achievement (any type; the unique index below is partial), delete_challenge
+    # and per-challenge achievement lists
+    ("idx_achievements_period", "Achievements", "period_id, member_id, achievement_type"),
+]
 
+def create_indexes(cursor):
+    """Creates the secondary indexes if missing and refreshes the planner statistics."""
+    for name, table, columns in SECONDARY_INDEXES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns});")
+    cursor.execute("ANALYZE;")
+
+# --- Base Schema ---
+# The schema every database had before versioned migrations (user_version 0).
+# Later changes go in MIGRATIONS below, never here.
+def create_base_schema(cursor):
     # --- App Settings Table ---
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS AppSettings (
@@ -44,9 +56,9 @@ def create_database():
     if cursor.fetchone()[0] == 0:
         # REMOVED: Default values for penalty rules
         cursor.execute("INSERT INTO GlobalSettings VALUES (1, 10, 5, 50, 25, 3, 1, 25);")
-    
+
     cursor.execute("CREATE TABLE IF NOT EXISTS Books (book_id INTEGER PRIMARY KEY, title TEXT NOT NULL UNIQUE, author TEXT, publication_year INTEGER);")
-    
+
     # REMOVED: All penalty-related columns from ChallengePeriods
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS ChallengePeriods (
@@ -86,12 +98,164 @@ def create_database():
     );
     """)
     cursor.execute("CREATE TABLE IF NOT EXISTS GroupStats (period_id INTEGER PRIMARY KEY, total_group_minutes_common INTEGER DEFAULT 0, total_group_minutes_other INTEGER DEFAULT 0, total_group_quotes_common INTEGER DEFAULT 0, total_group_quotes_other INTEGER DEFAULT 0, active_members INTEGER DEFAULT 0, FOREIGN KEY (period_id) REFERENCES ChallengePeriods (period_id));")
-    
+
     cursor.execute("DROP TABLE IF EXISTS ChallengeSpecificRules")
 
+# --- Migrations ---
+# Each step runs once per database, in order, and records its version in
+# PRAGMA user_version. Steps must be idempotent: databases created before the
+# runner existed start at version 0 but may already have some of the changes.
+BACKFILL_BATCH_SIZE = 5000
+
+def backfill_in_batches(conn, table, set_clause, pending_condition, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Runs `UPDATE table SET set_clause` on the rows matching pending_condition,
+    one committed batch at a time so the app can keep reading and writing in
+    between. The update must make pending_condition false for the rows it touches.
+    Returns the number of rows updated.
+    """
+    total = 0
+    while True:
+        with conn:
+            cursor = conn.execute(
+                f"UPDATE {table} SET {set_clause} WHERE rowid IN (SELECT rowid FROM {table} WHERE {pending_condition} LIMIT ?)",
+                (batch_size,)
+            )
+        if cursor.rowcount <= 0:
+            return total
+        total += cursor.rowcount
+
+def _migrate_achievements_unique_index(conn):
+    # A member can finish the common book / attend the discussion once per challenge.
+    # FINISHED_OTHER_BOOK is left out on purpose: several other books can be finished.
+    with conn:
+        # Older syncs could record these twice: keep the earliest one
+        cursor = conn.execute("""
+        DELETE FROM Achievements
+        WHERE achievement_type IN ('FINISHED_COMMON_BOOK', 'ATTENDED_DISCUSSION')
+          AND achievement_id NOT IN (
+            SELECT MIN(achievement_id) FROM Achievements
+            WHERE achievement_type IN ('FINISHED_COMMON_BOOK', 'ATTENDED_DISCUSSION')
+            GROUP BY member_id, achievement_type, period_id
+          );
+        """)
+        if cursor.rowcount > 0:
+            print(f"Removed {cursor.rowcount} duplicate achievements.")
+            conn.execute("INSERT OR REPLACE INTO AppSettings (key, value) VALUES ('stats_dirty', '1')")
+        conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_achievements_once_per_period
+        ON Achievements (member_id, achievement_type, period_id)
+        WHERE achievement_type IN ('FINISHED_COMMON_BOOK', 'ATTENDED_DISCUSSION');
+        """)
+
+def _migrate_member_period_stats(conn):
+    cursor = conn.cursor()
+    # --- Per-member-per-period points, broken down by source (filled by the stats engine) ---
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS MemberPeriodStats (
+        period_id INTEGER NOT NULL,
+        member_id INTEGER NOT NULL,
+        logs_count INTEGER DEFAULT 0,
+        minutes_common INTEGER DEFAULT 0,
+        minutes_other INTEGER DEFAULT 0,
+        quotes_common INTEGER DEFAULT 0,
+        quotes_other INTEGER DEFAULT 0,
+        finished_common_count INTEGER DEFAULT 0,
+        finished_other_count INTEGER DEFAULT 0,
+        attended_count INTEGER DEFAULT 0,
+        points_common_minutes INTEGER DEFAULT 0,
+        points_other_minutes INTEGER DEFAULT 0,
+        points_common_quotes INTEGER DEFAULT 0,
+        points_other_quotes INTEGER DEFAULT 0,
+        points_finish_common INTEGER DEFAULT 0,
+        points_finish_other INTEGER DEFAULT 0,
+        points_attend INTEGER DEFAULT 0,
+        total_points INTEGER DEFAULT 0,
+        PRIMARY KEY (period_id, member_id),
+        FOREIGN KEY (period_id) REFERENCES ChallengePeriods (period_id),
+        FOREIGN KEY (member_id) REFERENCES Members (member_id)
+    );
+    """)
+    # An existing database gets the table empty: have the next sync rebuild all stats
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM ReadingLogs) AND NOT EXISTS (SELECT 1 FROM MemberPeriodStats)")
+    if cursor.fetchone()[0]:
+        cursor.execute("INSERT OR REPLACE INTO AppSettings (key, value) VALUES ('stats_dirty', '1')")
     conn.commit()
-    conn.close()
-    print("\nDatabase setup complete! Simplified schema (no penalties) has been applied.")
+
+def _migrate_iso_submission_dates(conn):
+    # ISO dates sort and compare as text, so SQL can range-filter them (BETWEEN)
+    migrated = backfill_in_batches(
+        conn, "ReadingLogs",
+        "submission_date = substr(submission_date, 7, 4) || '-' || substr(submission_date, 4, 2) || '-' || substr(submission_date, 1, 2)",
+        "submission_date LIKE '__/__/____'"
+    )
+    if migrated:
+        print(f"Migrated {migrated} reading log dates to ISO format.")
+
+def _migrate_secondary_indexes(conn):
+    create_indexes(conn.cursor())
+
+def _migrate_sheet_snapshot(conn):
+    # Last fetched Form Responses rows, keyed by Timestamp, used to diff the next
+    # full fetch and to open the record editor without downloading the sheet
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS SheetSnapshot (
+        timestamp TEXT PRIMARY KEY,
+        sheet_row INTEGER NOT NULL,
+        row_hash INTEGER NOT NULL,
+        key_hash INTEGER NOT NULL,
+        row_json TEXT NOT NULL
+    );
+    """)
+
+# (version, description, step). Append new steps with the next version number.
+MIGRATIONS = [
+    (1, "unique once-per-challenge achievements", _migrate_achievements_unique_index),
+    (2, "MemberPeriodStats table", _migrate_member_period_stats),
+    (3, "ISO-8601 ReadingLogs.submission_date", _migrate_iso_submission_dates),
+    (4, "secondary indexes on ReadingLogs and Achievements", _migrate_secondary_indexes),
+    (5, "SheetSnapshot staging table", _migrate_sheet_snapshot),
+]
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def run_migrations(conn):
+    """Applies the pending migrations in order. Returns the versions applied."""
+    applied = []
+    current_version = get_schema_version(conn)
+    for version, description, migrate in MIGRATIONS:
+        if version <= current_version:
+            continue
+        print(f"Applying migration {version}: {description}...")
+        migrate(conn)
+        with conn:
+            # Cached dashboard data may predate the change: bump the data generation
+            conn.execute("""
+            INSERT INTO AppSettings (key, value) VALUES ('data_generation', '1')
+            ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+            """)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+        applied.append(version)
+    return applied
+
+def create_database():
+    """
+    Sets up or updates the database schema: creates the base tables if
+    missing, then applies any pending migrations. Safe to run on every start.
+    Returns the migration versions applied.
+    """
+    os.makedirs(DB_FOLDER, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        print(f"Database connection established. Building simplified schema (no penalties)...")
+        create_base_schema(conn.cursor())
+        conn.commit()
+        applied = run_migrations(conn)
+    finally:
+        conn.close()
+    print(f"\nDatabase setup complete! Schema version {MIGRATIONS[-1][0]} ({len(applied)} migrations applied).")
+    return applied
 
 if __name__ == '__main__':
     create_database()
@@ -1,5 +1,8 @@
 import sqlite3
+import json
 import os
+import threading
+from contextlib import contextmanager
 import pandas as pd
 
 # --- Constants ---
@@ -7,24 +10,85 @@ DB_FOLDER = 'data'
 DB_NAME = 'reading_tracker.db'
 DB_PATH = os.path.join(DB_FOLDER, DB_NAME)
 
+# WAL lets the dashboard keep reading while a sync is writing; the rest trades
+# a little durability on power loss (never corruption) for fewer fsyncs.
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -32000",      # ~32 MB page cache
+    "PRAGMA mmap_size = 268435456",    # 256 MB memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA foreign_keys = OFF",
+]
+
+# --- Connection Management ---
+# One persistent connection per thread (sqlite3 connections must not be
+# shared across threads). It is opened lazily and reused by every function.
+_local = threading.local()
+
 def get_db_connection():
-    """Establishes and returns a database connection."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """Returns this thread's database connection, opening and configuring it on first use."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != DB_PATH:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        _local.conn, _local.path, _local.depth = conn, DB_PATH, 0
     return conn
 
+def close_db_connection():
+    """Closes this thread's connection (e.g. when a worker thread or CLI run is done)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+@contextmanager
+def transaction():
+    """
+    Unit of work on this thread's connection: commits when the outermost block
+    exits cleanly and rolls back if it raises. Nested blocks (e.g. write
+    functions called inside a caller's transaction) join the outer one.
+    """
+    conn = get_db_connection()
+    if _local.depth:
+        _local.depth += 1
+        try:
+            yield conn
+        finally:
+            _local.depth -= 1
+        return
+    _local.depth = 1
+    try:
+        with conn:
+            yield conn
+    finally:
+        _local.depth = 0
+
+# --- Data Generation Counter ---
+# Bumped inside every write transaction so readers (e.g. the Streamlit cache
+# in app.py) can tell whether anything changed since they last loaded data.
+
+def _bump_data_generation(conn):
+    conn.execute("""
+        INSERT INTO AppSettings (key, value) VALUES ('data_generation', '1')
+        ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+    """)
+
+def get_data_generation():
+    """Returns the current data generation (0 for a database that was never written to)."""
+    return int(get_setting('data_generation') or 0)
+
 # --- AppSettings Functions ---
 
 def set_setting(key, value):
     """Saves or updates a key-value pair in the AppSettings table."""
-    conn = get_db_connection()
     try:
-        with conn:
+        with transaction() as conn:
             conn.execute("INSERT OR REPLACE INTO AppSettings (key, value) VALUES (?, ?)", (key, str(value)))
     except sqlite3.Error as e:
         print(f"Database error in set_setting: {e}")
-    finally:
-        conn.close()
 
 def get_setting(key):
     """Retrieves a value by its key from the AppSettings table."""
@@ -35,19 +99,14 @@ def get_setting(key):
     except sqlite3.Error as e:
         print(f"Database error in get_setting: {e}")
         return None
-    finally:
-        conn.close()
 
 # --- READ Functions ---
 
 def load_global_settings():
     """Loads the general rules of the challenge (points only)."""
     conn = get_db_connection()
-    try:
-        settings_row = conn.execute("SELECT * FROM GlobalSettings WHERE setting_id = 1").fetchone()
-        return dict(settings_row) if settings_row else None
-    finally:
-        conn.close()
+    settings_row = conn.execute("SELECT * FROM GlobalSettings WHERE setting_id = 1").fetchone()
+    return dict(settings_row) if settings_row else None
 
 def get_all_data_for_stats():
     """Fetches all data needed for the calculation engine in one go for efficiency."""
@@ -62,8 +121,6 @@ def get_all_data_for_stats():
     except sqlite3.Error as e:
         print(f"Error fetching all data from database: {e}")
         return None
-    finally:
-        conn.close()
     
     return {"members": members, "logs": logs, "achievements": achievements, "periods": periods}
 
@@ -75,48 +132,87 @@ def get_table_as_df(table_name):
     except Exception as e:
         print(f"Error reading table {table_name}: {e}")
         df = pd.DataFrame()
-    finally:
-        conn.close()
     return df
 
 def check_log_exists(timestamp):
     conn = get_db_connection()
     log_exists = conn.execute("SELECT 1 FROM ReadingLogs WHERE timestamp = ?", (timestamp,)).fetchone()
-    conn.close()
     return log_exists is not None
 
 def has_achievement(member_id, achievement_type, period_id):
     conn = get_db_connection()
     query = "SELECT 1 FROM Achievements WHERE member_id = ? AND achievement_type = ? AND period_id = ?"
     achievement_exists = conn.execute(query, (member_id, achievement_type, period_id)).fetchone()
-    conn.close()
     return achievement_exists is not None
 
+def get_unique_achievement_keys():
+    """
+    Returns the set of (member_id, achievement_type, period_id) keys for the
+    achievements that can only happen once per member per challenge.
+    """
+    conn = get_db_connection()
+    query = "SELECT member_id, achievement_type, period_id FROM Achievements WHERE achievement_type IN ('FINISHED_COMMON_BOOK', 'ATTENDED_DISCUSSION')"
+    return {tuple(row) for row in conn.execute(query).fetchall()}
+
+def get_active_member_periods(period_ids):
+    """Returns the (member_id, period_id) pairs that already have at least one log in the given periods."""
+    if not period_ids:
+        return []
+    conn = get_db_connection()
+    placeholders = ", ".join("?" * len(period_ids))
+    query = f"SELECT member_id, period_id FROM MemberPeriodStats WHERE logs_count > 0 AND period_id IN ({placeholders})"
+    return [dict(row) for row in conn.execute(query, [int(p) for p in period_ids]).fetchall()]
+
+def get_member_period_stats(period_id):
+    """Returns the MemberPeriodStats rows of one challenge joined with member names, ordered by name."""
+    conn = get_db_connection()
+    try:
+        query = "SELECT mps.*, m.name FROM MemberPeriodStats mps JOIN Members m ON mps.member_id = m.member_id WHERE mps.period_id = ? ORDER BY m.name"
+        df = pd.read_sql_query(query, conn, params=(int(period_id),))
+    except Exception as e:
+        print(f"Error reading member period stats: {e}")
+        df = pd.DataFrame()
+    return df
+
 def did_submit_quote_today(member_id, submission_date, quote_type):
     conn = get_db_connection()
     column_to_check = "submitted_common_quote" if quote_type == 'COMMON' else "submitted_other_quote"
     query = f"SELECT 1 FROM ReadingLogs WHERE member_id = ? AND submission_date = ? AND {column_to_check} = 1"
     quote_exists = conn.execute(query, (member_id, submission_date)).fetchone()
-    conn.close()
     return quote_exists is not None
 
+def get_reading_minutes_between(start_date, end_date):
+    """Total reading minutes (common + other) logged between two ISO dates, inclusive."""
+    conn = get_db_connection()
+    query = "SELECT COALESCE(SUM(common_book_minutes + other_book_minutes), 0) FROM ReadingLogs WHERE submission_date BETWEEN ? AND ?"
+    return conn.execute(query, (str(start_date), str(end_date))).fetchone()[0]
+
+def get_achievements_between(start_date, end_date, achievement_types):
+    """Returns the achievements of the given types dated between two ISO dates, inclusive."""
+    conn = get_db_connection()
+    placeholders = ", ".join("?" * len(achievement_types))
+    query = f"SELECT * FROM Achievements WHERE achievement_date BETWEEN ? AND ? AND achievement_type IN ({placeholders})"
+    return [dict(row) for row in conn.execute(query, (str(start_date), str(end_date), *achievement_types)).fetchall()]
+
 # --- WRITE/UPDATE Functions ---
 
 def add_members(names_list):
     """Adds a list of new members, setting them as active by default."""
-    conn = get_db_connection()
-    with conn:
-        conn.executemany("INSERT OR IGNORE INTO Members (name) VALUES (?)", [(name,) for name in names_list])
-    conn.close()
+    with transaction() as conn:
+        _bump_data_generation(conn)
+        cursor = conn.executemany("INSERT OR IGNORE INTO Members (name) VALUES (?)", [(name,) for name in names_list])
+        if cursor.rowcount:
+            # Rows from these names were rejected as unknown members until now
+            _force_full_resync(conn)
 
 def add_single_member(name):
     """
     Adds a single new member or reactivates an existing inactive one.
     Returns a status tuple: (status_code, message)
     """
-    conn = get_db_connection()
     try:
-        with conn:
+        with transaction() as conn:
+            _bump_data_generation(conn)
             cursor = conn.execute("SELECT member_id, is_active FROM Members WHERE name = ?", (name,))
             member = cursor.fetchone()
             
@@ -128,30 +224,28 @@ def add_single_member(name):
                     return ('reactivated', f"تمت إعادة تنشيط العضو '{name}' بنجاح.")
             else:
                 conn.execute("INSERT INTO Members (name) VALUES (?)", (name,))
+                # Rows from this name were rejected as an unknown member until now
+                _force_full_resync(conn)
                 return ('added', f"تمت إضافة العضو الجديد '{name}' بنجاح.")
     except sqlite3.Error as e:
         return ('error', f"Database error: {e}")
-    finally:
-        conn.close()
 
 def set_member_status(member_id, is_active: int):
     """Sets a member's status to active (1) or inactive (0)."""
-    conn = get_db_connection()
     try:
-        with conn:
+        with transaction() as conn:
+            _bump_data_generation(conn)
             conn.execute("UPDATE Members SET is_active = ? WHERE member_id = ?", (is_active, member_id))
         return True
     except sqlite3.Error as e:
         print(f"Database error in set_member_status: {e}")
         return False
-    finally:
-        conn.close()
 
 def add_book_and_challenge(book_info, challenge_info, rules_info):
     """Adds a new book and a new challenge period with its specific point rules."""
-    conn = get_db_connection()
     try:
-        with conn:
+        with transaction() as conn:
+            _bump_data_generation(conn)
             cursor = conn.execute("INSERT INTO Books (title, author, publication_year) VALUES (?, ?, ?)",
                                   (book_info['title'], book_info['author'], book_info['year']))
             book_id = cursor.lastrowid
@@ -178,28 +272,219 @@ def add_book_and_challenge(book_info, challenge_info, rules_info):
                     :attend_discussion_points
                 )
             """, challenge_data)
+            # Logs may now fall into (or out of) a challenge with different rules
+            _force_full_resync(conn)
         return True, "تمت إضافة التحدي بنجاح."
     except sqlite3.Error as e:
         if "UNIQUE constraint failed: Books.title" in str(e):
              return False, f"خطأ: كتاب بعنوان '{book_info['title']}' موجود بالفعل في قاعدة البيانات."
         print(f"Database error in add_book_and_challenge: {e}")
         return False, f"خطأ في قاعدة البيانات: {e}"
-    finally:
-        conn.close()
+
+UPSERT_LOG_QUERY = """
+    INSERT INTO ReadingLogs (
+        timestamp, member_id, submission_date, common_book_minutes,
+        other_book_minutes, submitted_common_quote, submitted_other_quote
+    ) VALUES (
+        :timestamp, :member_id, :submission_date, :common_book_minutes,
+        :other_book_minutes, :submitted_common_quote, :submitted_other_quote
+    )
+    ON CONFLICT(timestamp) DO UPDATE SET
+        member_id = excluded.member_id,
+        submission_date = excluded.submission_date,
+        common_book_minutes = excluded.common_book_minutes,
+        other_book_minutes = excluded.other_book_minutes,
+        submitted_common_quote = excluded.submitted_common_quote,
+        submitted_other_quote = excluded.submitted_other_quote
+"""
+
+INSERT_ACHIEVEMENT_QUERY = "INSERT INTO Achievements (member_id, achievement_type, achievement_date, period_id, book_id) VALUES (?, ?, ?, ?, ?)"
 
 def add_log_and_achievements(log_data, achievements_to_add):
-    conn = get_db_connection()
-    with conn:
-        conn.execute("INSERT INTO ReadingLogs (timestamp, member_id, submission_date, common_book_minutes, other_book_minutes, submitted_common_quote, submitted_other_quote) VALUES (:timestamp, :member_id, :submission_date, :common_book_minutes, :other_book_minutes, :submitted_common_quote, :submitted_other_quote)", log_data)
+    with transaction() as conn:
+        _bump_data_generation(conn)
+        conn.execute(UPSERT_LOG_QUERY, log_data)
         if achievements_to_add:
-            conn.executemany("INSERT INTO Achievements (member_id, achievement_type, achievement_date, period_id, book_id) VALUES (?, ?, ?, ?, ?)", achievements_to_add)
-    conn.close()
+            conn.executemany(INSERT_ACHIEVEMENT_QUERY, achievements_to_add)
 
-def rebuild_stats_tables(member_stats_data, group_stats_data):
-    conn = get_db_connection()
-    with conn:
+def _executemany_collecting_rejects(conn, query, rows):
+    """
+    Runs executemany on the open transaction. If any row is rejected by SQLite,
+    the batch is rolled back to a savepoint and replayed row by row so the good
+    rows still land. Returns (rows_written, [(row, reason), ...]).
+    """
+    if not rows:
+        return 0, []
+    conn.execute("SAVEPOINT bulk_insert")
+    try:
+        conn.executemany(query, rows)
+        conn.execute("RELEASE bulk_insert")
+        return len(rows), []
+    except sqlite3.Error:
+        conn.execute("ROLLBACK TO bulk_insert")
+        conn.execute("RELEASE bulk_insert")
+
+    rows_written, rejects = 0, []
+    for row in rows:
+        try:
+            conn.execute(query, row)
+            rows_written += 1
+        except sqlite3.Error as e:
+            rejects.append((row, str(e)))
+    return rows_written, rejects
+
+def _existing_log_timestamps(conn, timestamps, chunk_size=500):
+    """Returns which of the given timestamps are already stored in ReadingLogs."""
+    existing = set()
+    for i in range(0, len(timestamps), chunk_size):
+        chunk = timestamps[i:i + chunk_size]
+        placeholders = ", ".join("?" * len(chunk))
+        rows = conn.execute(f"SELECT timestamp FROM ReadingLogs WHERE timestamp IN ({placeholders})", chunk).fetchall()
+        existing.update(row['timestamp'] for row in rows)
+    return existing
+
+def get_existing_log_timestamps(timestamps):
+    """Returns which of the given timestamps are already stored in ReadingLogs."""
+    return _existing_log_timestamps(get_db_connection(), list(timestamps))
+
+def bulk_add_logs_and_achievements(logs, achievements):
+    """
+    Inserts a whole batch of parsed logs and achievements on one connection,
+    inside one transaction (a single commit for the entire sync).
+    Returns a dict with:
+      - logs_written / achievements_written: row counts that reached the DB
+      - new_logs / new_achievements: the rows that were inserted (not updates, not rejects)
+      - updated_timestamps: logs that replaced an existing row with the same timestamp
+      - rejects: (row, reason) for every row SQLite refused
+    Errors that are not about a single row (e.g. "database is locked") are
+    raised after nothing of the batch was committed, so the sync can fail.
+    """
+    result = {"logs_written": 0, "achievements_written": 0, "new_logs": [], "new_achievements": [], "updated_timestamps": [], "rejects": []}
+    try:
+        with transaction() as conn:
+            _bump_data_generation(conn)
+            existing = _existing_log_timestamps(conn, [log['timestamp'] for log in logs])
+            logs_written, log_rejects = _executemany_collecting_rejects(conn, UPSERT_LOG_QUERY, logs)
+            achievements_written, achievement_rejects = _executemany_collecting_rejects(conn, INSERT_ACHIEVEMENT_QUERY, achievements)
+            if existing:
+                _mark_stats_dirty(conn)
+        rejected_ids = {id(row) for row, _ in log_rejects + achievement_rejects}
+        result.update(
+            logs_written=logs_written,
+            achievements_written=achievements_written,
+            new_logs=[log for log in logs if id(log) not in rejected_ids and log['timestamp'] not in existing],
+            new_achievements=[a for a in achievements if id(a) not in rejected_ids],
+            updated_timestamps=sorted(existing),
+            rejects=log_rejects + achievement_rejects,
+        )
+    except sqlite3.Error as e:
+        print(f"Database error in bulk_add_logs_and_achievements: {e}")
+        raise
+    return result
+
+def _mark_stats_dirty(conn):
+    """Flags the stats tables as stale: the next sync must rebuild them instead of applying deltas."""
+    conn.execute("INSERT OR REPLACE INTO AppSettings (key, value) VALUES ('stats_dirty', '1')")
+
+def _force_full_resync(conn):
+    """
+    Makes the next sync rebuild everything from the whole sheet: the period and
+    achievements of every stored log were derived from the old challenge list.
+    Clearing the watermark forces a full fetch, and clearing the snapshot
+    columns makes reconcile_with_snapshot ask for a rebuild.
+    """
+    _mark_stats_dirty(conn)
+    conn.execute("UPDATE AppSettings SET value = '' WHERE key IN ('sync_row_count', 'sync_last_timestamp', ?)", (SNAPSHOT_COLUMNS_KEY,))
+
+def stats_are_dirty():
+    """True when edits, deletes or rule changes have invalidated incremental stats."""
+    return get_setting('stats_dirty') == '1'
+
+def apply_stats_deltas(member_deltas, group_deltas, member_period_deltas=()):
+    """
+    Adds deltas computed from newly inserted rows only onto MemberStats (per
+    member), GroupStats (per period) and MemberPeriodStats (per member and
+    period) with UPSERTs, in one transaction. Each member_period_deltas row also
+    carries its period's minutes_per_point_common/other rules, because reading
+    points are floored on the period total and must be recomputed.
+    Raises on database errors, so the sync fails instead of moving on.
+    """
+    try:
+        with transaction() as conn:
+            _bump_data_generation(conn)
+            conn.executemany("""
+                INSERT INTO MemberStats (
+                    member_id, total_points, total_reading_minutes_common,
+                    total_reading_minutes_other, total_common_books_read,
+                    total_other_books_read, total_quotes_submitted,
+                    meetings_attended, last_log_date, last_quote_date
+                ) VALUES (
+                    :member_id, :total_points, :total_reading_minutes_common,
+                    :total_reading_minutes_other, :total_common_books_read,
+                    :total_other_books_read, :total_quotes_submitted,
+                    :meetings_attended, :last_log_date, :last_quote_date
+                )
+                ON CONFLICT(member_id) DO UPDATE SET
+                    total_points = total_points + excluded.total_points,
+                    total_reading_minutes_common = total_reading_minutes_common + excluded.total_reading_minutes_common,
+                    total_reading_minutes_other = total_reading_minutes_other + excluded.total_reading_minutes_other,
+                    total_common_books_read = total_common_books_read + excluded.total_common_books_read,
+                    total_other_books_read = total_other_books_read + excluded.total_other_books_read,
+                    total_quotes_submitted = total_quotes_submitted + excluded.total_quotes_submitted,
+                    meetings_attended = meetings_attended + excluded.meetings_attended,
+                    last_log_date = NULLIF(MAX(COALESCE(last_log_date, ''), COALESCE(excluded.last_log_date, '')), ''),
+                    last_quote_date = NULLIF(MAX(COALESCE(last_quote_date, ''), COALESCE(excluded.last_quote_date, '')), '')
+            """, member_deltas)
+            conn.executemany("""
+                INSERT INTO GroupStats (
+                    period_id, total_group_minutes_common, total_group_minutes_other,
+                    total_group_quotes_common, total_group_quotes_other, active_members
+                ) VALUES (
+                    :period_id, :total_group_minutes_common, :total_group_minutes_other,
+                    :total_group_quotes_common, :total_group_quotes_other, :active_members
+                )
+                ON CONFLICT(period_id) DO UPDATE SET
+                    total_group_minutes_common = total_group_minutes_common + excluded.total_group_minutes_common,
+                    total_group_minutes_other = total_group_minutes_other + excluded.total_group_minutes_other,
+                    total_group_quotes_common = total_group_quotes_common + excluded.total_group_quotes_common,
+                    total_group_quotes_other = total_group_quotes_other + excluded.total_group_quotes_other,
+                    active_members = active_members + excluded.active_members
+            """, group_deltas)
+            additive_columns = [col for col in MEMBER_PERIOD_STATS_COLUMNS if col not in ('period_id', 'member_id', 'points_common_minutes', 'points_other_minutes', 'total_points')]
+            conn.executemany(INSERT_MEMBER_PERIOD_STATS_QUERY + """
+                ON CONFLICT(period_id, member_id) DO UPDATE SET
+            """ + ",\n".join(f"{col} = {col} + excluded.{col}" for col in additive_columns) + """,
+                    points_common_minutes = CASE WHEN :minutes_per_point_common > 0 THEN (minutes_common + excluded.minutes_common) / :minutes_per_point_common ELSE 0 END,
+                    points_other_minutes = CASE WHEN :minutes_per_point_other > 0 THEN (minutes_other + excluded.minutes_other) / :minutes_per_point_other ELSE 0 END
+            """, member_period_deltas)
+            conn.executemany("""
+                UPDATE MemberPeriodStats
+                SET total_points = points_common_minutes + points_other_minutes + points_common_quotes + points_other_quotes
+                                 + points_finish_common + points_finish_other + points_attend
+                WHERE period_id = :period_id AND member_id = :member_id
+            """, member_period_deltas)
+        return True
+    except sqlite3.Error as e:
+        print(f"Database error in apply_stats_deltas: {e}")
+        raise
+
+MEMBER_PERIOD_STATS_COLUMNS = [
+    'period_id', 'member_id', 'logs_count', 'minutes_common', 'minutes_other',
+    'quotes_common', 'quotes_other', 'finished_common_count', 'finished_other_count', 'attended_count',
+    'points_common_minutes', 'points_other_minutes', 'points_common_quotes', 'points_other_quotes',
+    'points_finish_common', 'points_finish_other', 'points_attend', 'total_points'
+]
+INSERT_MEMBER_PERIOD_STATS_QUERY = f"""
+    INSERT INTO MemberPeriodStats ({", ".join(MEMBER_PERIOD_STATS_COLUMNS)})
+    VALUES ({", ".join(":" + col for col in MEMBER_PERIOD_STATS_COLUMNS)})
+"""
+
+def rebuild_stats_tables(member_stats_data, group_stats_data, member_period_stats_data=()):
+    with transaction() as conn:
+        _bump_data_generation(conn)
         conn.execute("DELETE FROM MemberStats;")
         conn.execute("DELETE FROM GroupStats;")
+        conn.execute("DELETE FROM MemberPeriodStats;")
         if member_stats_data:
             conn.executemany("""
                 INSERT INTO MemberStats (
@@ -216,12 +501,14 @@ def rebuild_stats_tables(member_stats_data, group_stats_data):
             """, member_stats_data)
         if group_stats_data:
              conn.executemany("INSERT INTO GroupStats (period_id, total_group_minutes_common, total_group_minutes_other, total_group_quotes_common, total_group_quotes_other, active_members) VALUES (:period_id, :total_group_minutes_common, :total_group_minutes_other, :total_group_quotes_common, :total_group_quotes_other, :active_members)", group_stats_data)
-    conn.close()
+        if member_period_stats_data:
+            conn.executemany(INSERT_MEMBER_PERIOD_STATS_QUERY, member_period_stats_data)
+        conn.execute("INSERT OR REPLACE INTO AppSettings (key, value) VALUES ('stats_dirty', '')")
 
 def update_global_settings(settings_dict):
-    conn = get_db_connection()
     try:
-        with conn:
+        with transaction() as conn:
+            _bump_data_generation(conn)
             conn.execute("""
                 UPDATE GlobalSettings
                 SET minutes_per_point_common = :minutes_per_point_common,
@@ -237,16 +524,16 @@ def update_global_settings(settings_dict):
     except sqlite3.Error as e:
         print(f"Error updating settings: {e}")
         return False
-    finally:
-        conn.close()
 
 def delete_challenge(period_id):
     """Deletes a challenge period and associated data."""
-    conn = get_db_connection()
     try:
-        with conn:
+        with transaction() as conn:
+            _bump_data_generation(conn)
             conn.execute("DELETE FROM Achievements WHERE period_id = ?", (period_id,))
             conn.execute("DELETE FROM GroupStats WHERE period_id = ?", (period_id,))
+            conn.execute("DELETE FROM MemberPeriodStats WHERE period_id = ?", (period_id,))
+            _force_full_resync(conn)
             cursor = conn.execute("SELECT common_book_id FROM ChallengePeriods WHERE period_id = ?", (period_id,))
             result = cursor.fetchone()
             if result:
@@ -259,25 +546,24 @@ def delete_challenge(period_id):
     except sqlite3.Error as e:
         print(f"Database error in delete_challenge: {e}")
         return False
-    finally:
-        conn.close()
 
 def clear_all_logs_and_achievements():
     """
     Wipes the ReadingLogs and Achievements tables for a full resync.
     This is crucial for the new robust synchronization logic.
+    Raises on database errors, so the enclosing resync rolls back.
     """
-    conn = get_db_connection()
     try:
-        with conn:
+        with transaction() as conn:
+            _bump_data_generation(conn)
             conn.execute("DELETE FROM ReadingLogs;")
             conn.execute("DELETE FROM Achievements;")
+            # The sync watermark no longer describes what is in the tables
+            conn.execute("UPDATE AppSettings SET value = '' WHERE key IN ('sync_row_count', 'sync_last_timestamp')")
         return True
     except sqlite3.Error as e:
         print(f"Database error in clear_all_logs_and_achievements: {e}")
-        return False
-    finally:
-        conn.close()
+        raise
 
 def get_all_logs_with_member_names():
     """
@@ -304,6 +590,60 @@ def get_all_logs_with_member_names():
     except Exception as e:
         print(f"Error reading logs with member names: {e}")
         df = pd.DataFrame()
-    finally:
-        conn.close()
     return df
+
+# --- Sheet Snapshot ---
+# Local copy of the last fetched Form Responses rows (see main.reconcile_with_snapshot).
+# It mirrors the sheet rather than the tracker data, so writes here do not bump
+# the data generation.
+SNAPSHOT_COLUMNS_KEY = 'sheet_snapshot_columns'
+
+def get_sheet_snapshot_columns():
+    """The sheet columns the snapshot was taken with, or None when there is no snapshot."""
+    columns = get_setting(SNAPSHOT_COLUMNS_KEY)
+    return json.loads(columns) if columns else None
+
+def get_sheet_snapshot_hashes():
+    """Returns the snapshot's timestamp, sheet_row, row_hash and key_hash columns as a DataFrame."""
+    conn = get_db_connection()
+    try:
+        df = pd.read_sql_query("SELECT timestamp, sheet_row, row_hash, key_hash FROM SheetSnapshot", conn)
+    except Exception as e:
+        print(f"Error reading sheet snapshot: {e}")
+        df = pd.DataFrame(columns=['timestamp', 'sheet_row', 'row_hash', 'key_hash'])
+    return df
+
+def get_sheet_snapshot_frame():
+    """The snapshot as a sheet-shaped DataFrame (in sheet order, with a sheet_row_index column), or an empty one."""
+    columns = get_sheet_snapshot_columns()
+    if not columns:
+        return pd.DataFrame()
+    conn = get_db_connection()
+    rows = conn.execute("SELECT sheet_row, row_json FROM SheetSnapshot ORDER BY sheet_row").fetchall()
+    df = pd.DataFrame([json.loads(row['row_json']) for row in rows], columns=columns, dtype=object)
+    df['sheet_row_index'] = [row['sheet_row'] for row in rows]
+    return df
+
+def save_sheet_snapshot(columns, rows, removed_timestamps=(), replace=False):
+    """
+    Brings the snapshot up to date: upserts rows (dicts of timestamp, sheet_row,
+    row_hash, key_hash, row_json) and deletes removed_timestamps; replace=True
+    drops every other row first. Raises on database errors.
+    """
+    try:
+        with transaction() as conn:
+            if replace:
+                conn.execute("DELETE FROM SheetSnapshot")
+            conn.executemany("DELETE FROM SheetSnapshot WHERE timestamp = ?", [(ts,) for ts in removed_timestamps])
+            conn.executemany("""
+                INSERT OR REPLACE INTO SheetSnapshot (timestamp, sheet_row, row_hash, key_hash, row_json)
+                VALUES (:timestamp, :sheet_row, :row_hash, :key_hash, :row_json)
+            """, rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO AppSettings (key, value) VALUES (?, ?)",
+                (SNAPSHOT_COLUMNS_KEY, json.dumps(list(columns), ensure_ascii=False))
+            )
+        return True
+    except sqlite3.Error as e:
+        print(f"Database error in save_sheet_snapshot: {e}")
+        raise
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import tempfile
+
+def make_key(*parts):
+    """A stable hex key for the given parts (strings or bytes)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class DiskLRUCache:
+    """
+    A folder of cached blobs, one file per key, capped at max_bytes.
+    Reading an entry refreshes its mtime; writing one evicts the least recently
+    used files until the folder fits the cap again. Entries are written to a
+    temporary file and renamed into place, so several threads or Streamlit
+    processes can share the folder. A cache that cannot be written (full disk,
+    read-only folder) only logs and behaves as a miss.
+    """
+    def __init__(self, folder, max_bytes, suffix='.bin'):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + self.suffix)
+
+    def get(self, key):
+        """The cached bytes for key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key, data):
+        tmp_path = None
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            tmp_path = None
+            self._evict()
+        except OSError as e:
+            print(f"Disk cache write failed in {self.folder}: {e}")
+        finally:
+            if tmp_path:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _evict(self):
+        entries = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.name.endswith(self.suffix):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -1,10 +1,43 @@
+import argparse
+import json
+import sqlite3
+import time
 import pandas as pd
-from datetime import datetime, date, timedelta
 import db_manager as db
+from period_index import PeriodIndex
+from sheet_reader import FORM_RESPONSES_WORKSHEET, fetch_sheet_frame, hash_rows
 import gspread
 
-def run_data_update(gc: gspread.Client):
-    update_log = ["--- بدء عملية تحديث بيانات التحدي ---"]
+# --- Sync watermark keys (stored in AppSettings) ---
+SYNC_ROW_COUNT_KEY = 'sync_row_count'
+SYNC_LAST_TIMESTAMP_KEY = 'sync_last_timestamp'
+# Rows the parser rejected (e.g. from a member not added yet): the watermark moves
+# past them, so every incremental sync re-reads them by position and retries them
+SYNC_RETRY_ROWS_KEY = 'sync_retry_rows'
+
+class SyncLog(list):
+    """The update log of a sync; each line is also passed to progress(message, elapsed_seconds) as it happens."""
+    def __init__(self, progress=None):
+        super().__init__()
+        self.progress = progress
+        self.started = time.perf_counter()
+
+    def append(self, message):
+        super().append(message)
+        if self.progress:
+            self.progress(message, time.perf_counter() - self.started)
+
+def run_data_update(gc: gspread.Client, full_resync=False, full_fetch=False, progress=None):
+    """
+    Syncs the database with the form responses sheet.
+    By default only the rows appended since the last sync are fetched.
+    full_fetch: re-read the whole sheet and ingest only the rows that differ from
+        the local snapshot (e.g. after older rows were edited).
+    full_resync: re-read the whole sheet and rebuild everything from it.
+    progress: optional callback streamed each log line with the elapsed time.
+    """
+    update_log = SyncLog(progress)
+    update_log.append("--- بدء عملية تحديث بيانات التحدي ---")
     spreadsheet_url = db.get_setting("spreadsheet_url")
     if not spreadsheet_url:
         update_log.append("❌ خطأ: لم يتم العثور على رابط جدول البيانات في الإعدادات.")
@@ -12,174 +45,638 @@ def run_data_update(gc: gspread.Client):
     update_log.append(f"🔗 جاري سحب البيانات من Google Sheet...")
     try:
         spreadsheet = gc.open_by_url(spreadsheet_url)
-        worksheet = spreadsheet.worksheet("Form Responses 1")
-        records = worksheet.get_all_records()
-        raw_data_df = pd.DataFrame(records)
-        update_log.append(f"✅ تم العثور على {len(raw_data_df)} صف في الجدول.")
+        worksheet = spreadsheet.worksheet(FORM_RESPONSES_WORKSHEET)
+        header = worksheet.row_values(1)
+        sheet_df, rows_df, appended_df = None, None, None
+        if not (full_resync or full_fetch):
+            appended_df = fetch_rows_above_watermark(worksheet, header)
+            retry_df = fetch_rows_to_retry(worksheet, header) if appended_df is not None else None
+            if retry_df is not None:
+                rows_df = pd.concat([retry_df, appended_df]) if not retry_df.empty else appended_df
+        if rows_df is None:
+            # Explicit request, first sync, or the sheet changed below the watermark
+            sheet_df = fetch_sheet_frame(worksheet, header, PARSER_COLUMNS)
+            update_log.append(f"✅ تم العثور على {len(sheet_df)} صف في الجدول.")
+        else:
+            update_log.append("✅ تم سحب الصفوف الجديدة فقط منذ آخر مزامنة.")
     except Exception as e:
         update_log.append(f"❌ خطأ أثناء سحب البيانات: {e}")
         return update_log
 
-    if raw_data_df is not None and not raw_data_df.empty:
-        all_data = db.get_all_data_for_stats()
-        if not all_data or not all_data.get("members") or not all_data.get("periods"):
-            update_log.append("❌ خطأ حرج: لم تكتمل عملية الإعداد.")
-            return update_log
-        
-        # --- NEW ROBUST LOGIC ---
-        update_log.append("🔄 جاري مسح السجلات القديمة استعداداً للمزامنة الكاملة...")
-        db.clear_all_logs_and_achievements()
-        update_log.append("👍 تم مسح السجلات بنجاح.")
-
-        entries_processed = process_all_data(raw_data_df, all_data)
-        update_log.append(f"🔄 تمت معالجة وإعادة إدخال {entries_processed} تسجيل.")
-        
-        update_log.append("🧮 جاري حساب وتحديث جميع الإحصائيات...")
-        calculate_and_update_stats()
-        update_log.append("✅ اكتمل حساب الإحصائيات.")
-    else:
+    if sheet_df is not None and sheet_df.empty:
         update_log.append("ℹ️ لا توجد بيانات جديدة في الجدول.")
+        update_log.append("\n--- ✅ انتهت عملية مزامنة البيانات بنجاح ---")
+        return update_log
+
+    all_data = db.get_all_data_for_stats()
+    if not all_data or not all_data.get("members") or not all_data.get("periods"):
+        update_log.append("❌ خطأ حرج: لم تكتمل عملية الإعداد.")
+        return update_log
+
+    snapshot_diff = None
+    if sheet_df is not None:
+        snapshot_diff = reconcile_with_snapshot(sheet_df)
+        if not full_resync and snapshot_diff['rows_to_ingest'] is not None:
+            rows_df = snapshot_diff['rows_to_ingest']
+            update_log.append(f"🔍 مقارنة مع النسخة المحلية: {len(rows_df)} صف جديد أو معدّل.")
+
+    # Any database failure aborts the sync before the watermark and the
+    # snapshot move: the next sync then fetches the same rows again
+    ingest = None
+    try:
+        rebuild = rows_df is None
+        if rebuild:
+            # One unit of work: dashboard readers keep seeing the old data until
+            # the wipe, the re-insert and the stats rebuild commit together
+            with db.transaction():
+                update_log.append("🔄 جاري مسح السجلات القديمة استعداداً للمزامنة الكاملة...")
+                db.clear_all_logs_and_achievements()
+                update_log.append("👍 تم مسح السجلات بنجاح.")
+                entries_processed, ingest = process_all_data(sheet_df, all_data)
+                update_log.append(f"🔄 تمت معالجة وإعادة إدخال {entries_processed} تسجيل.")
+                update_log.append("🧮 جاري حساب وتحديث جميع الإحصائيات...")
+                calculate_and_update_stats()
+                update_log.append("✅ اكتمل حساب الإحصائيات.")
+        elif rows_df.empty:
+            update_log.append("ℹ️ لا توجد صفوف جديدة منذ آخر مزامنة.")
+        else:
+            update_log.append(f"⚡ مزامنة تزايدية: {len(rows_df)} صف جديد أو معدّل.")
+            entries_processed, ingest = process_all_data(rows_df, all_data)
+            update_log.append(f"🔄 تمت معالجة وإدخال {entries_processed} تسجيل.")
+        skipped_rows = ingest['skipped_rows'] if ingest else []
+        if skipped_rows:
+            update_log.append(f"⚠️ تم تجاهل {len(skipped_rows)} صف غير صالح من الجدول (ستُعاد محاولته في المزامنة القادمة):")
+            for row, reason in skipped_rows[:10]:
+                update_log.append(f"   - الصف {row['sheet_row']} ({row['timestamp'] or '-'}): {reason}")
+        if ingest and ingest['rejects']:
+            update_log.append(f"⚠️ رفضت قاعدة البيانات {len(ingest['rejects'])} صف:")
+            for row, reason in ingest['rejects'][:10]:
+                row_label = row.get('timestamp') if isinstance(row, dict) else row
+                update_log.append(f"   - {row_label}: {reason}")
+
+        # A rebuild already recalculated the stats inside its transaction
+        if not rebuild:
+            if db.stats_are_dirty():
+                update_log.append("🧮 جاري حساب وتحديث جميع الإحصائيات...")
+                calculate_and_update_stats()
+                update_log.append("✅ اكتمل حساب الإحصائيات.")
+            elif ingest and (ingest['new_logs'] or ingest['new_achievements']):
+                update_log.append("🧮 جاري تحديث الإحصائيات بالسجلات الجديدة فقط...")
+                apply_incremental_stats(ingest['new_logs'], ingest['new_achievements'], all_data)
+                update_log.append("✅ اكتمل تحديث الإحصائيات.")
+
+        if sheet_df is not None:
+            save_sync_watermark(sheet_df)
+            save_snapshot_changes(sheet_df, snapshot_diff, skipped_rows)
+        elif not rows_df.empty:
+            if not appended_df.empty:
+                save_sync_watermark(appended_df)
+            append_to_snapshot(rows_df, skipped_rows)
+        save_rows_to_retry(skipped_rows)
+    except sqlite3.Error as e:
+        update_log.append(f"❌ خطأ في قاعدة البيانات، لم يتم حفظ المزامنة وسيُعاد سحب نفس الصفوف في المرة القادمة: {e}")
+        return update_log
     update_log.append("\n--- ✅ انتهت عملية مزامنة البيانات بنجاح ---")
     return update_log
 
-def parse_duration_to_minutes(duration_str):
-    if not isinstance(duration_str, str) or not duration_str: return 0
-    try:
-        parts = list(map(int, duration_str.split(':')))
-        h, m, s = (parts + [0, 0, 0])[:3]
-        return h * 60 + m
-    except (ValueError, TypeError): return 0
+def fetch_rows_above_watermark(worksheet, header):
+    """
+    Fetches only the sheet rows appended since the last sync, or returns None
+    when a full resync is needed (never synced, rows deleted, or older rows
+    edited/shifted). Form responses are appended to the sheet, so the watermark
+    is the number of ingested rows plus the Timestamp of the last one, which is
+    re-read as an anchor together with the new rows.
+    """
+    row_count = int(db.get_setting(SYNC_ROW_COUNT_KEY) or 0)
+    last_timestamp = db.get_setting(SYNC_LAST_TIMESTAMP_KEY)
+    if not row_count or not last_timestamp:
+        return None
+    # Data row N is sheet row N + 1 (row 1 is the header)
+    df = fetch_sheet_frame(worksheet, header, PARSER_COLUMNS, start_row=row_count + 1)
+    if df.empty or str(df.iloc[0].get('Timestamp', '')).strip() != last_timestamp:
+        return None
+    return df.iloc[1:]
+
+def fetch_rows_to_retry(worksheet, header):
+    """
+    Re-reads the rows earlier syncs rejected, in one request spanning them, so
+    they are parsed again (a member may have been added or a date fixed since).
+    Returns an empty frame when there are none, or None when one of them is no
+    longer at its row (the sheet changed: a full fetch is needed).
+    """
+    retry_rows = json.loads(db.get_setting(SYNC_RETRY_ROWS_KEY) or '[]')
+    if not retry_rows:
+        return pd.DataFrame()
+    indexes = [index for index, _ in retry_rows]
+    # index + 2 is the sheet row
+    df = fetch_sheet_frame(worksheet, header, PARSER_COLUMNS, start_row=min(indexes) + 2, end_row=max(indexes) + 2)
+    if not pd.Index(indexes).isin(df.index).all():
+        return None
+    df = df.loc[indexes]
+    if _sheet_column(df, 'timestamp').astype(str).str.strip().tolist() != [timestamp for _, timestamp in retry_rows]:
+        return None
+    return df
+
+def save_rows_to_retry(skipped_rows):
+    """Stores the (index, Timestamp) of the rejected rows the next incremental sync retries."""
+    retry_rows = sorted((row['sheet_row'] - 2, row['timestamp']) for row, _ in skipped_rows if row['timestamp'])
+    db.set_setting(SYNC_RETRY_ROWS_KEY, json.dumps(retry_rows, ensure_ascii=False))
+
+def save_sync_watermark(df):
+    """Stores the high-water mark from the last fetched row (index + 1 is its data row number)."""
+    db.set_setting(SYNC_ROW_COUNT_KEY, int(df.index[-1]) + 1)
+    db.set_setting(SYNC_LAST_TIMESTAMP_KEY, str(df.iloc[-1].get('Timestamp', '')).strip())
+
+# --- Sheet Snapshot ---
+# The last fetched rows are kept in SheetSnapshot, keyed by Timestamp, with a hash
+# of the whole row and a hash of the columns achievements are derived from. A full
+# fetch is diffed against it in memory so only new or edited rows are ingested.
+SNAPSHOT_KEY_FIELDS = ['member_name', 'submission_date', 'achievements']
+# Stored instead of the row hash of a row the parser rejected: it never matches,
+# so every full fetch sees the row as edited and parses it again
+REJECTED_ROW_HASH = 0
+
+def _snapshot_hashes(df):
+    """timestamp, sheet_row, row_hash, key_hash for each fetched row (index kept)."""
+    key_columns = [column for field in SNAPSHOT_KEY_FIELDS for column in SHEET_COLUMNS[field] if column in df]
+    return pd.DataFrame({
+        'timestamp': _sheet_column(df, 'timestamp').astype(str).str.strip(),
+        'sheet_row': df.index + 2,
+        'row_hash': hash_rows(df),
+        'key_hash': hash_rows(df[key_columns]),
+    }, index=df.index)
+
+def _snapshot_records(df, hashes, skipped_rows=()):
+    """SheetSnapshot rows for the given fetched rows."""
+    rejected = hashes['sheet_row'].isin([row['sheet_row'] for row, _ in skipped_rows])
+    records = hashes.assign(
+        row_hash=hashes['row_hash'].mask(rejected, REJECTED_ROW_HASH),
+        row_json=[json.dumps(list(row), ensure_ascii=False) for row in df.itertuples(index=False, name=None)],
+    )
+    return frame_to_records(records)
+
+def reconcile_with_snapshot(sheet_df):
+    """
+    Diffs a full fetch against the local snapshot by Timestamp and content hash.
+    Returns a dict with:
+      rows_to_ingest: the new and edited rows, or None when the change cannot be
+        applied row by row and a full rebuild is needed (no snapshot yet, other
+        columns, duplicate or removed Timestamps, or an edit to a row's member,
+        date or achievements, which can change the achievements of other rows);
+      changed_index, removed_timestamps, replace: what the snapshot needs to catch up.
+    """
+    hashes = _snapshot_hashes(sheet_df)
+    hashes = hashes[hashes['timestamp'] != '']
+    if db.get_sheet_snapshot_columns() != list(sheet_df.columns) or hashes['timestamp'].duplicated().any():
+        return {'rows_to_ingest': None, 'changed_index': hashes.index, 'removed_timestamps': [], 'replace': True}
+
+    previous = db.get_sheet_snapshot_hashes()
+
+    merged = hashes.reset_index().merge(previous, on='timestamp', how='outer', suffixes=('', '_old'), indicator=True)
+    added = merged['_merge'] == 'left_only'
+    removed = merged['_merge'] == 'right_only'
+    both = merged['_merge'] == 'both'
+    edited = both & (merged['row_hash'] != merged['row_hash_old'])
+    moved = both & (merged['sheet_row'] != merged['sheet_row_old'])
+    key_edited = both & (merged['key_hash'] != merged['key_hash_old'])
+
+    ingest_index = merged.loc[added | edited, 'index'].astype('int64')
+    rows_to_ingest = None if removed.any() or key_edited.any() else sheet_df.loc[ingest_index.sort_values()]
+    return {
+        'rows_to_ingest': rows_to_ingest,
+        'changed_index': merged.loc[added | edited | moved, 'index'].astype('int64'),
+        'removed_timestamps': merged.loc[removed, 'timestamp'].tolist(),
+        'replace': False,
+    }
+
+def save_snapshot_changes(sheet_df, snapshot_diff, skipped_rows=()):
+    """Applies a reconcile_with_snapshot result to the snapshot."""
+    changed_df = sheet_df.loc[snapshot_diff['changed_index']]
+    hashes = _snapshot_hashes(changed_df)
+    db.save_sheet_snapshot(
+        sheet_df.columns, _snapshot_records(changed_df, hashes, skipped_rows),
+        snapshot_diff['removed_timestamps'], replace=snapshot_diff['replace']
+    )
+
+def append_to_snapshot(rows_df, skipped_rows=()):
+    """Adds incrementally fetched rows to the snapshot (skipped if it was taken with other columns)."""
+    if db.get_sheet_snapshot_columns() != list(rows_df.columns):
+        return
+    hashes = _snapshot_hashes(rows_df)
+    hashes = hashes[hashes['timestamp'] != '']
+    db.save_sheet_snapshot(rows_df.columns, _snapshot_records(rows_df.loc[hashes.index], hashes, skipped_rows))
+
+# --- Sheet Row Parsing ---
+# Form questions were renamed over time; each field lists its column names in
+# order of preference (a later one is used when the earlier ones are empty).
+SHEET_COLUMNS = {
+    'timestamp': ['Timestamp'],
+    'submission_date': ['تاريخ القراءة'],
+    'member_name': ['اسمك'],
+    'common_duration': ['مدة قراءة الكتاب المشترك', 'مدة قراءة الكتاب المشترك (اختياري)'],
+    'other_duration': ['مدة قراءة كتاب آخر (إن وجد)', 'مدة قراءة كتاب آخر (اختياري)'],
+    'quotes': ['ما هي الاقتباسات التي أرسلتها اليوم؟ (اختر كل ما ينطبق)', 'ما هي الاقتباسات التي أرسلتها اليوم؟ (اختياري)'],
+    'achievements': ['إنجازات الكتب والنقاش', 'إنجازات الكتب والنقاش (اختر فقط عند حدوثه لأول مرة)'],
+}
+PARSER_COLUMNS = {column for columns in SHEET_COLUMNS.values() for column in columns}
+# Durations are H:MM or H:MM:SS text; a bare number is not a duration (0 minutes)
+DURATION_PATTERN = r'^(\d+):(\d+)(?::(\d+))?$'
+
+def _sheet_column(df, field):
+    """The first non-empty value among a field's columns, row-wise ('' when all are empty)."""
+    result = pd.Series('', index=df.index, dtype=object)
+    for column in reversed(SHEET_COLUMNS[field]):
+        if column in df:
+            values = df[column]
+            filled = values.notna() & (values != '') & (values != 0)
+            result = values.where(filled, result)
+    return result
+
+def _durations_to_minutes(values):
+    """H:M[:S] duration strings -> whole minutes (seconds dropped); 0 for non-strings or malformed values."""
+    text = values.where(values.map(type) == str, '').str.strip()
+    parts = text.str.extract(DURATION_PATTERN).fillna(0).astype('int64')
+    return parts[0] * 60 + parts[1]
+
+def parse_sheet_rows(df, member_map):
+    """
+    Turns the raw get_all_records frame into a typed logs frame, column by column.
+    Returns (logs_df, rejects): logs_df keeps the sheet index and has timestamp,
+    member_id, submission_date (ISO), the minutes and quote flags, plus the
+    finished_common/attended/finished_other achievement flags; rejects is a
+    list of ({'timestamp', 'sheet_row'}, reason) for the rows that were skipped.
+    """
+    timestamps = _sheet_column(df, 'timestamp').astype(str).str.strip()
+    date_part = _sheet_column(df, 'submission_date').astype(str).str.strip().str.split(' ').str[0]
+    submission_dates = pd.to_datetime(date_part, format='%Y-%m-%d', errors='coerce')
+    member_names = _sheet_column(df, 'member_name').astype(str).str.strip()
+    member_ids = member_names.map(member_map)
+
+    reasons = pd.Series(None, index=df.index, dtype=object)
+    reasons[member_ids.isna()] = "عضو غير معروف: " + member_names[member_ids.isna()]
+    reasons[submission_dates.isna()] = "تاريخ قراءة غير صالح: " + date_part[submission_dates.isna()]
+    reasons[timestamps == ''] = "لا يوجد Timestamp"
+    rejected = reasons.notna()
+    # Sheet rows are 1-based and row 1 is the header
+    rejects = [
+        ({'timestamp': timestamps[i], 'sheet_row': int(i) + 2}, reasons[i])
+        for i in reasons.index[rejected]
+    ]
+
+    accepted = ~rejected
+    quotes = _sheet_column(df, 'quotes').astype(str)[accepted]
+    achievements = _sheet_column(df, 'achievements').astype(str)[accepted]
+    logs_df = pd.DataFrame({
+        'timestamp': timestamps[accepted],
+        'member_id': member_ids[accepted].astype('int64'),
+        'submission_date': submission_dates[accepted].dt.strftime('%Y-%m-%d'),
+        'common_book_minutes': _durations_to_minutes(_sheet_column(df, 'common_duration')[accepted]),
+        'other_book_minutes': _durations_to_minutes(_sheet_column(df, 'other_duration')[accepted]),
+        'submitted_common_quote': quotes.str.contains('الكتاب المشترك', regex=False).astype('int64'),
+        'submitted_other_quote': quotes.str.contains('كتاب آخر', regex=False).astype('int64'),
+        'finished_common': achievements.str.contains('أنهيت الكتاب المشترك', regex=False).astype(bool),
+        'attended': achievements.str.contains('حضرت جلسة النقاش', regex=False).astype(bool),
+        'finished_other': achievements.str.contains('أنهيت كتاباً آخر', regex=False).astype(bool),
+    })
+    return logs_df, rejects
+
+def _achievements_from_logs(logs_df, periods, achievement_keys):
+    """
+    Builds the achievement rows flagged in the parsed logs (already in timestamp
+    order). Finishing the common book and attending the discussion count once per
+    member per period: the first row wins and keys already in the DB are skipped.
+    Several other books can be finished, so every flagged row counts for those.
+    """
+    in_period = logs_df[logs_df['period_id'].notna()]
+    common_book_ids = {p['period_id']: p['common_book_id'] for p in periods}
+    frames = []
+    for flag, achievement_type, once_per_period in [
+        ('finished_common', 'FINISHED_COMMON_BOOK', True),
+        ('attended', 'ATTENDED_DISCUSSION', True),
+        ('finished_other', 'FINISHED_OTHER_BOOK', False),
+    ]:
+        rows = in_period[in_period[flag]]
+        if once_per_period:
+            rows = rows.drop_duplicates(subset=['member_id', 'period_id'])
+            keys = list(zip(rows['member_id'], [achievement_type] * len(rows), rows['period_id']))
+            rows = rows[pd.Series([key not in achievement_keys for key in keys], index=rows.index, dtype=bool)]
+        book_ids = rows['period_id'].map(common_book_ids).astype('Int64') if achievement_type == 'FINISHED_COMMON_BOOK' else None
+        frames.append(pd.DataFrame({
+            'member_id': rows['member_id'], 'achievement_type': achievement_type,
+            'achievement_date': rows['submission_date'], 'period_id': rows['period_id'],
+            'book_id': book_ids,
+        }))
+    # Stable sort keeps the per-row order of the old row-by-row parser
+    achievements_df = pd.concat(frames).sort_index(kind='stable')
+    return [tuple(a.values()) for a in frame_to_records(achievements_df)]
 
 def process_all_data(df, all_data):
+    """
+    Parses the sheet rows and writes them through the bulk ingest path.
+    Returns (entries_processed_count, ingest_result) where ingest_result is the
+    dict returned by db.bulk_add_logs_and_achievements, plus 'skipped_rows':
+    the (row, reason) pairs the parser rejected.
+    """
     member_map = {member['name']: member['member_id'] for member in all_data['members']}
-    today = date.today()
-    entries_processed_count = 0
-    
-    # Sort dataframe by timestamp to process achievements in order
-    df = df.sort_values(by='Timestamp').reset_index(drop=True)
-
-    for index, row in df.iterrows():
-        timestamp = str(row.get('Timestamp', '')).strip()
-        if not timestamp:
-            continue
-        
-        submission_date_str = str(row.get('تاريخ القراءة', '')).strip()
-        try:
-            date_part = submission_date_str.split(' ')[0]
-            submission_date_obj = datetime.strptime(date_part, '%Y-%m-%d').date()
-        except (ValueError, TypeError, IndexError):
-            continue
-        
-        member_name = str(row.get('اسمك', '')).strip()
-        member_id = member_map.get(member_name)
-        if not member_id: continue
-        
-        entries_processed_count += 1
-        
-        quote_responses = str(row.get('ما هي الاقتباسات التي أرسلتها اليوم؟ (اختر كل ما ينطبق)', '') or row.get('ما هي الاقتباسات التي أرسلتها اليوم؟ (اختياري)', ''))
-        common_quote_today = 1 if 'الكتاب المشترك' in quote_responses else 0
-        other_quote_today = 1 if 'كتاب آخر' in quote_responses else 0
-            
-        log_data = {
-            "timestamp": timestamp, "member_id": member_id, "submission_date": submission_date_obj.strftime('%d/%m/%Y'),
-            "common_book_minutes": parse_duration_to_minutes(row.get('مدة قراءة الكتاب المشترك') or row.get('مدة قراءة الكتاب المشترك (اختياري)')),
-            "other_book_minutes": parse_duration_to_minutes(row.get('مدة قراءة كتاب آخر (إن وجد)') or row.get('مدة قراءة كتاب آخر (اختياري)')),
-            "submitted_common_quote": common_quote_today,
-            "submitted_other_quote": other_quote_today,
-        }
-        
-        achievements_to_add = []
-        achievement_responses = str(row.get('إنجازات الكتب والنقاش', '') or row.get('إنجازات الكتب والنقاش (اختر فقط عند حدوثه لأول مرة)', ''))
-        current_period = next((p for p in all_data['periods'] if datetime.strptime(p['start_date'], '%Y-%m-%d').date() <= submission_date_obj <= datetime.strptime(p['end_date'], '%Y-%m-%d').date()), None)
-
-        if current_period:
-            period_id = current_period['period_id']
-            # We check the DB here because it's being populated in this same loop
-            if 'أنهيت الكتاب المشترك' in achievement_responses and not db.has_achievement(member_id, 'FINISHED_COMMON_BOOK', period_id):
-                achievements_to_add.append((member_id, 'FINISHED_COMMON_BOOK', str(submission_date_obj), period_id, current_period['common_book_id']))
-            if 'حضرت جلسة النقاش' in achievement_responses and not db.has_achievement(member_id, 'ATTENDED_DISCUSSION', period_id):
-                 achievements_to_add.append((member_id, 'ATTENDED_DISCUSSION', str(submission_date_obj), period_id, None))
-            if 'أنهيت كتاباً آخر' in achievement_responses:
-                # For "other book", we don't check for duplicates within the challenge, as one can finish multiple other books
-                achievements_to_add.append((member_id, 'FINISHED_OTHER_BOOK', str(submission_date_obj), period_id, None))
-        
-        db.add_log_and_achievements(log_data, achievements_to_add)
-    return entries_processed_count
+    # Sort by timestamp to process achievements in order (the index stays the sheet row)
+    df = df.sort_values(by='Timestamp', kind='stable') if 'Timestamp' in df else df
+    logs_df, skipped_rows = parse_sheet_rows(df, member_map)
+
+    period_index = PeriodIndex(all_data['periods'])
+    logs_df['period_id'] = period_index.assign_periods(logs_df['submission_date'])
+    # Rows already in ReadingLogs are updates of edited minutes or quotes (any
+    # other edit forces a rebuild): their achievements were recorded on first ingest
+    existing = db.get_existing_log_timestamps(logs_df['timestamp'])
+    new_logs_df = logs_df[~logs_df['timestamp'].isin(existing)]
+    achievements_to_add = _achievements_from_logs(new_logs_df, all_data['periods'], db.get_unique_achievement_keys())
+    logs_to_add = frame_to_records(logs_df[['timestamp', 'member_id', 'submission_date'] + LOG_NUMERIC_COLUMNS])
+
+    ingest_result = db.bulk_add_logs_and_achievements(logs_to_add, achievements_to_add)
+    ingest_result['skipped_rows'] = skipped_rows
+    return len(logs_df), ingest_result
 
 
+# --- Stats Engine ---
+
+LOG_NUMERIC_COLUMNS = ['common_book_minutes', 'other_book_minutes', 'submitted_common_quote', 'submitted_other_quote']
+RULE_COLUMNS = [
+    'minutes_per_point_common', 'minutes_per_point_other',
+    'quote_common_book_points', 'quote_other_book_points',
+    'finish_common_book_points', 'finish_other_book_points', 'attend_discussion_points'
+]
+ACHIEVEMENT_POINTS_RULE = {
+    'FINISHED_COMMON_BOOK': 'finish_common_book_points',
+    'ATTENDED_DISCUSSION': 'attend_discussion_points',
+    'FINISHED_OTHER_BOOK': 'finish_other_book_points',
+}
+
+def _rules_for(period_ids, rules_df, column):
+    """Looks up one rule column for every row's period_id (0 when outside every challenge)."""
+    return period_ids.map(rules_df[column]).fillna(0).astype('int64')
+
+def _floor_points(minutes, minutes_per_point):
+    """Row-wise minutes // minutes_per_point, 0 where the rule is disabled."""
+    points = pd.Series(0, index=minutes.index, dtype='int64')
+    enabled = minutes_per_point > 0
+    points[enabled] = minutes[enabled] // minutes_per_point[enabled]
+    return points
+
+def prepare_logs_frame(logs, period_index, rules_df):
+    """
+    Builds the typed logs frame used by the stats engine: parsed dates,
+    integer columns, the period_id of every log and the points it earned.
+    """
+    logs_df = pd.DataFrame(logs)
+    if logs_df.empty:
+        return logs_df
+    logs_df['submission_date_ts'] = pd.to_datetime(logs_df['submission_date'], format='%Y-%m-%d', errors='coerce')
+    for col in LOG_NUMERIC_COLUMNS:
+        logs_df[col] = pd.to_numeric(logs_df[col], errors='coerce').fillna(0).astype('int64')
+    logs_df['period_id'] = period_index.assign_periods(logs_df['submission_date_ts'])
+
+    period_ids = logs_df['period_id']
+    logs_df['points'] = (
+        _floor_points(logs_df['common_book_minutes'], _rules_for(period_ids, rules_df, 'minutes_per_point_common'))
+        + _floor_points(logs_df['other_book_minutes'], _rules_for(period_ids, rules_df, 'minutes_per_point_other'))
+        + logs_df['submitted_common_quote'] * _rules_for(period_ids, rules_df, 'quote_common_book_points')
+        + logs_df['submitted_other_quote'] * _rules_for(period_ids, rules_df, 'quote_other_book_points')
+    )
+    logs_df['quotes'] = logs_df['submitted_common_quote'] + logs_df['submitted_other_quote']
+    logs_df['quote_date_ts'] = logs_df['submission_date_ts'].where(logs_df['quotes'] > 0)
+    return logs_df
+
+def prepare_achievements_frame(achievements, rules_df):
+    """Builds the achievements frame with the points each achievement earned under its period's rules."""
+    achievements_df = pd.DataFrame(achievements)
+    if achievements_df.empty:
+        return achievements_df
+    achievements_df['points'] = 0
+    for achievement_type, rule_column in ACHIEVEMENT_POINTS_RULE.items():
+        is_type = achievements_df['achievement_type'] == achievement_type
+        achievements_df.loc[is_type, 'points'] = _rules_for(achievements_df.loc[is_type, 'period_id'], rules_df, rule_column)
+    return achievements_df
+
+def _format_dates(series):
+    return series.dt.strftime('%Y-%m-%d').astype(object).where(series.notna(), None)
+
+def compute_member_stats(members, logs_df, achievements_df):
+    """
+    Aggregates the prepared logs and achievements into one MemberStats row per
+    member with a single groupby on each frame.
+    """
+    stats_df = pd.DataFrame({'member_id': [m['member_id'] for m in members]})
+
+    if not logs_df.empty:
+        log_totals = logs_df.groupby('member_id').agg(
+            log_points=('points', 'sum'),
+            total_reading_minutes_common=('common_book_minutes', 'sum'),
+            total_reading_minutes_other=('other_book_minutes', 'sum'),
+            total_quotes_submitted=('quotes', 'sum'),
+            last_log_date=('submission_date_ts', 'max'),
+            last_quote_date=('quote_date_ts', 'max'),
+        )
+        stats_df = stats_df.join(log_totals, on='member_id')
+
+    if not achievements_df.empty:
+        achievement_type = achievements_df['achievement_type']
+        achievement_totals = achievements_df.assign(
+            achievement_points=achievements_df['points'],
+            total_common_books_read=(achievement_type == 'FINISHED_COMMON_BOOK').astype('int64'),
+            total_other_books_read=(achievement_type == 'FINISHED_OTHER_BOOK').astype('int64'),
+            meetings_attended=(achievement_type == 'ATTENDED_DISCUSSION').astype('int64'),
+        ).groupby('member_id')[['achievement_points', 'total_common_books_read', 'total_other_books_read', 'meetings_attended']].sum()
+        stats_df = stats_df.join(achievement_totals, on='member_id')
+
+    count_columns = [
+        'log_points', 'achievement_points', 'total_reading_minutes_common', 'total_reading_minutes_other',
+        'total_quotes_submitted', 'total_common_books_read', 'total_other_books_read', 'meetings_attended'
+    ]
+    for col in count_columns:
+        stats_df[col] = stats_df[col].fillna(0).astype('int64') if col in stats_df else 0
+    for col in ['last_log_date', 'last_quote_date']:
+        stats_df[col] = _format_dates(stats_df[col]) if col in stats_df else None
+
+    stats_df['total_points'] = stats_df['log_points'] + stats_df['achievement_points']
+    return stats_df.drop(columns=['log_points', 'achievement_points'])
+
+GROUP_STATS_COLUMNS = [
+    'total_group_minutes_common', 'total_group_minutes_other',
+    'total_group_quotes_common', 'total_group_quotes_other', 'active_members'
+]
+
+def compute_group_stats(period_ids, logs_df):
+    """
+    Aggregates the prepared logs into one GroupStats row per challenge period
+    (logs outside every challenge are not counted).
+    """
+    stats_df = pd.DataFrame({'period_id': list(period_ids)}, dtype='int64')
+    if not logs_df.empty:
+        period_totals = logs_df[logs_df['period_id'].notna()].groupby('period_id').agg(
+            total_group_minutes_common=('common_book_minutes', 'sum'),
+            total_group_minutes_other=('other_book_minutes', 'sum'),
+            total_group_quotes_common=('submitted_common_quote', 'sum'),
+            total_group_quotes_other=('submitted_other_quote', 'sum'),
+            active_members=('member_id', 'nunique'),
+        )
+        period_totals.index = period_totals.index.astype('int64')
+        stats_df = stats_df.join(period_totals, on='period_id')
+    for col in GROUP_STATS_COLUMNS:
+        stats_df[col] = stats_df[col].fillna(0).astype('int64') if col in stats_df else 0
+    return stats_df
+
+MEMBER_PERIOD_COUNT_COLUMNS = [
+    'logs_count', 'minutes_common', 'minutes_other', 'quotes_common', 'quotes_other',
+    'finished_common_count', 'finished_other_count', 'attended_count'
+]
+
+def compute_member_period_stats(logs_df, achievements_df, rules_df):
+    """
+    Aggregates the prepared logs and achievements into one MemberPeriodStats
+    row per (member, period), with the points broken down by source. Reading
+    points are floored on the member's period total, like the challenge podium.
+    """
+    keys = ['period_id', 'member_id']
+    frames = []
+    if not logs_df.empty:
+        period_logs = logs_df[logs_df['period_id'].notna()]
+        frames.append(period_logs.groupby(keys).agg(
+            logs_count=('timestamp', 'size'),
+            minutes_common=('common_book_minutes', 'sum'),
+            minutes_other=('other_book_minutes', 'sum'),
+            quotes_common=('submitted_common_quote', 'sum'),
+            quotes_other=('submitted_other_quote', 'sum'),
+        ))
+    if not achievements_df.empty:
+        period_achievements = achievements_df[achievements_df['period_id'].isin(rules_df.index)]
+        achievement_type = period_achievements['achievement_type']
+        frames.append(period_achievements.assign(
+            finished_common_count=(achievement_type == 'FINISHED_COMMON_BOOK').astype('int64'),
+            finished_other_count=(achievement_type == 'FINISHED_OTHER_BOOK').astype('int64'),
+            attended_count=(achievement_type == 'ATTENDED_DISCUSSION').astype('int64'),
+        ).groupby(keys)[['finished_common_count', 'finished_other_count', 'attended_count']].sum())
+    if not frames:
+        return pd.DataFrame(columns=keys + MEMBER_PERIOD_COUNT_COLUMNS)
+
+    for frame in frames:
+        frame.index = frame.index.set_levels([level.astype('int64') for level in frame.index.levels])
+    stats_df = pd.concat(frames, axis=1).reset_index()
+    for col in MEMBER_PERIOD_COUNT_COLUMNS:
+        stats_df[col] = stats_df[col].fillna(0).astype('int64') if col in stats_df else 0
+
+    period_ids = stats_df['period_id']
+    stats_df['points_common_minutes'] = _floor_points(stats_df['minutes_common'], _rules_for(period_ids, rules_df, 'minutes_per_point_common'))
+    stats_df['points_other_minutes'] = _floor_points(stats_df['minutes_other'], _rules_for(period_ids, rules_df, 'minutes_per_point_other'))
+    stats_df['points_common_quotes'] = stats_df['quotes_common'] * _rules_for(period_ids, rules_df, 'quote_common_book_points')
+    stats_df['points_other_quotes'] = stats_df['quotes_other'] * _rules_for(period_ids, rules_df, 'quote_other_book_points')
+    stats_df['points_finish_common'] = stats_df['finished_common_count'] * _rules_for(period_ids, rules_df, 'finish_common_book_points')
+    stats_df['points_finish_other'] = stats_df['finished_other_count'] * _rules_for(period_ids, rules_df, 'finish_other_book_points')
+    stats_df['points_attend'] = stats_df['attended_count'] * _rules_for(period_ids, rules_df, 'attend_discussion_points')
+    stats_df['total_points'] = stats_df[[col for col in stats_df.columns if col.startswith('points_')]].sum(axis=1)
+    return stats_df
+
+def frame_to_records(df):
+    """DataFrame -> list of dicts with native Python values (sqlite3 cannot bind numpy ints)."""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
 def calculate_and_update_stats():
     all_data = db.get_all_data_for_stats()
     if not all_data or not all_data.get("members"): return
 
-    periods_map = {p['period_id']: p for p in all_data["periods"]}
-    logs_df = pd.DataFrame(all_data["logs"])
-    
+    rules_df = pd.DataFrame(all_data["periods"], columns=['period_id'] + RULE_COLUMNS).set_index('period_id')
+    period_index = PeriodIndex(all_data["periods"])
+    logs_df = prepare_logs_frame(all_data["logs"], period_index, rules_df)
+    achievements_df = prepare_achievements_frame(all_data["achievements"], rules_df)
+
+    member_stats_df = compute_member_stats(all_data["members"], logs_df, achievements_df)
+    group_stats_df = compute_group_stats(rules_df.index, logs_df)
+    member_period_stats_df = compute_member_period_stats(logs_df, achievements_df, rules_df)
+    db.rebuild_stats_tables(frame_to_records(member_stats_df), frame_to_records(group_stats_df), frame_to_records(member_period_stats_df))
+
+def apply_incremental_stats(new_logs, new_achievements, all_data):
+    """
+    Updates MemberStats, GroupStats and MemberPeriodStats from newly inserted
+    rows only. Every stat is either a sum (MemberStats points are floored per
+    log, so they add up), a max date, a count of members newly active in a
+    period, or reading points recomputed from the updated period totals, so the
+    batch totals are applied as deltas with UPSERTs instead of a full rebuild.
+    """
+    rules_df = pd.DataFrame(all_data["periods"], columns=['period_id'] + RULE_COLUMNS).set_index('period_id')
+    period_index = PeriodIndex(all_data["periods"])
+    logs_df = prepare_logs_frame(new_logs, period_index, rules_df)
+    achievements_df = prepare_achievements_frame(
+        [dict(zip(['member_id', 'achievement_type', 'achievement_date', 'period_id', 'book_id'], a)) for a in new_achievements],
+        rules_df
+    )
+    member_ids = {log['member_id'] for log in new_logs} | {a[0] for a in new_achievements}
+    member_deltas_df = compute_member_stats([{'member_id': m} for m in sorted(member_ids)], logs_df, achievements_df)
+
+    group_deltas_df = pd.DataFrame()
     if not logs_df.empty:
-        logs_df['submission_date_dt'] = pd.to_datetime(logs_df['submission_date'], format='%d/%m/%Y', errors='coerce').dt.date
-        numeric_cols = ['common_book_minutes', 'other_book_minutes', 'submitted_common_quote', 'submitted_other_quote']
-        for col in numeric_cols:
-            logs_df[col] = pd.to_numeric(logs_df[col], errors='coerce').fillna(0).astype(int)
-
-    achievements_df = pd.DataFrame(all_data["achievements"])
-    final_member_stats_data = []
-
-    for member in all_data["members"]:
-        member_id = member['member_id']
-        
-        member_stats = {
-            "member_id": member_id, "total_points": 0, "total_reading_minutes_common": 0, 
-            "total_reading_minutes_other": 0, "total_common_books_read": 0, 
-            "total_other_books_read": 0, "total_quotes_submitted": 0, 
-            "meetings_attended": 0, "last_log_date": None, "last_quote_date": None
-        }
-
-        member_logs_df = logs_df[logs_df['member_id'] == member_id] if not logs_df.empty else pd.DataFrame()
-        member_achievements_df = achievements_df[achievements_df['member_id'] == member_id] if not achievements_df.empty else pd.DataFrame()
-        
-        if not member_logs_df.empty:
-            for index, log in member_logs_df.iterrows():
-                log_date = log['submission_date_dt']
-                if pd.isna(log_date): continue
-
-                log_period = next((p for p in all_data['periods'] if datetime.strptime(p['start_date'], '%Y-%m-%d').date() <= log_date <= datetime.strptime(p['end_date'], '%Y-%m-%d').date()), None)
-
-                if log_period:
-                    if log_period['minutes_per_point_common'] > 0:
-                        member_stats['total_points'] += log['common_book_minutes'] // log_period['minutes_per_point_common']
-                    if log_period['minutes_per_point_other'] > 0:
-                        member_stats['total_points'] += log['other_book_minutes'] // log_period['minutes_per_point_other']
-                    
-                    member_stats['total_points'] += log['submitted_common_quote'] * log_period['quote_common_book_points']
-                    member_stats['total_points'] += log['submitted_other_quote'] * log_period['quote_other_book_points']
-
-        if not member_achievements_df.empty:
-            for index, achievement in member_achievements_df.iterrows():
-                period_id = achievement.get('period_id')
-                if period_id in periods_map:
-                    achievement_period_rules = periods_map[period_id]
-                    
-                    if achievement['achievement_type'] == 'FINISHED_COMMON_BOOK':
-                        member_stats['total_points'] += achievement_period_rules['finish_common_book_points']
-                    elif achievement['achievement_type'] == 'ATTENDED_DISCUSSION':
-                        member_stats['total_points'] += achievement_period_rules['attend_discussion_points']
-                    elif achievement['achievement_type'] == 'FINISHED_OTHER_BOOK':
-                        member_stats['total_points'] += achievement_period_rules['finish_other_book_points']
-
-        
-        if not member_logs_df.empty:
-            member_stats['total_reading_minutes_common'] = int(member_logs_df['common_book_minutes'].sum())
-            member_stats['total_reading_minutes_other'] = int(member_logs_df['other_book_minutes'].sum())
-            member_stats['total_quotes_submitted'] = int(member_logs_df['submitted_common_quote'].sum() + member_logs_df['submitted_other_quote'].sum())
-            member_stats['last_log_date'] = str(member_logs_df['submission_date_dt'].max())
-            quote_logs = member_logs_df[(member_logs_df['submitted_common_quote'] == 1) | (member_logs_df['submitted_other_quote'] == 1)]
-            if not quote_logs.empty and not quote_logs['submission_date_dt'].isnull().all():
-                member_stats['last_quote_date'] = str(quote_logs['submission_date_dt'].max())
-
-        if not member_achievements_df.empty:
-            member_stats['total_common_books_read'] = len(member_achievements_df[member_achievements_df['achievement_type'] == 'FINISHED_COMMON_BOOK'])
-            member_stats['total_other_books_read'] = len(member_achievements_df[member_achievements_df['achievement_type'] == 'FINISHED_OTHER_BOOK'])
-            member_stats['meetings_attended'] = len(member_achievements_df[member_achievements_df['achievement_type'] == 'ATTENDED_DISCUSSION'])
-            
-        final_member_stats_data.append(member_stats)
-    
-    db.rebuild_stats_tables(final_member_stats_data, [])
\ No newline at end of file
+        touched_periods = logs_df['period_id'].dropna().astype('int64').unique()
+        group_deltas_df = compute_group_stats(touched_periods, logs_df)
+        group_deltas_df['active_members'] = group_deltas_df['period_id'].map(
+            _count_newly_active_members(logs_df)
+        ).fillna(0).astype('int64')
+
+    member_period_deltas_df = compute_member_period_stats(logs_df, achievements_df, rules_df)
+    # The UPSERT recomputes floored reading points from the new period totals
+    for rule_column in ['minutes_per_point_common', 'minutes_per_point_other']:
+        member_period_deltas_df[rule_column] = _rules_for(member_period_deltas_df['period_id'], rules_df, rule_column)
+
+    db.apply_stats_deltas(
+        frame_to_records(member_deltas_df),
+        frame_to_records(group_deltas_df),
+        frame_to_records(member_period_deltas_df)
+    )
+
+def _count_newly_active_members(new_logs_df):
+    """
+    For each period, counts the members whose first log in that period is in
+    this batch (members with an existing MemberPeriodStats log count are active already).
+    """
+    batch_pairs = new_logs_df.loc[new_logs_df['period_id'].notna(), ['member_id', 'period_id']].drop_duplicates()
+    if batch_pairs.empty:
+        return pd.Series(dtype='int64')
+    batch_pairs['period_id'] = batch_pairs['period_id'].astype('int64')
+    known_pairs = pd.DataFrame(db.get_active_member_periods(batch_pairs['period_id'].unique().tolist()), columns=['member_id', 'period_id'])
+    batch_pairs = batch_pairs.merge(known_pairs.astype('int64'), on=['member_id', 'period_id'], how='left', indicator=True)
+    counts = batch_pairs[batch_pairs['_merge'] == 'left_only'].groupby('period_id').size()
+    return counts
+
+# --- Command Line ---
+def main_cli(argv=None):
+    """
+    Headless entry point, e.g. `python -m main sync --interval 300`.
+    Uses the token saved by signing in to the app (auth_manager.TOKEN_FILE).
+    """
+    parser = argparse.ArgumentParser(prog="python -m main", description="Reading Tracker command line tools.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    sync_parser = commands.add_parser('sync', help="Sync the database with the form responses sheet on a schedule.")
+    sync_parser.add_argument('--interval', type=float, default=300, help="seconds between syncs (default: 300)")
+    sync_parser.add_argument('--jitter', type=float, default=0.1, help="random +/- fraction of the interval (default: 0.1)")
+    sync_parser.add_argument('--max-backoff', type=float, default=3600, help="longest wait after repeated failures, in seconds (default: 3600)")
+    sync_parser.add_argument('--once', action='store_true', help="run a single sync and exit")
+    sync_parser.add_argument('--full-fetch', action='store_true', help="re-read the whole sheet on each run instead of only new rows")
+    args = parser.parse_args(argv)
+
+    # Imported here: both import this module, and the app does not need them
+    import auth_manager
+    import database_setup
+    import sync_worker
+
+    creds = auth_manager.load_stored_credentials()
+    if creds is None:
+        parser.exit(1, f"No usable token in {auth_manager.TOKEN_FILE}; sign in through the app first.\n")
+    database_setup.create_database()
+    try:
+        failures = sync_worker.run_scheduled_sync(
+            gspread.authorize(creds), args.interval, jitter=args.jitter, max_backoff=args.max_backoff,
+            runs=1 if args.once else None, full_fetch=args.full_fetch,
+        )
+    except KeyboardInterrupt:
+        print("Stopped.")
+        return 0
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main_cli())
@@ -2,21 +2,115 @@ import streamlit as st
 from fpdf import FPDF, XPos, YPos
 from datetime import datetime, date
 import pandas as pd
+import plotly
 import plotly.graph_objects as go
+import plotly.io as pio
 import io
 import os
+import tempfile
+import threading
 from PIL import Image
 import arabic_reshaper
 from bidi.algorithm import get_display
+from disk_cache import DiskLRUCache, make_key
 
 # --- Constants ---
 FONT_NAME = "Amiri-Regular.ttf"
 COVER_IMAGE = "cover_page.png"
+BACKGROUND_IMAGE = os.path.join("data", "cover_background.png") # COVER_IMAGE faded for page backgrounds
 A4_WIDTH = 210
 A4_HEIGHT = 297
 # --- AESTHETIC IMPROVEMENT ---
 ACCENT_COLOR = (41, 128, 185) # A professional blue color
 LINE_COLOR = (200, 200, 200) # A light gray for separator lines
+# --- Chart Rendering ---
+CHART_WIDTH, CHART_HEIGHT, CHART_SCALE = 800, 500, 2
+DASHBOARD_FIGURES = ['fig_growth', 'fig_donut', 'fig_bar_days', 'fig_points_leaderboard', 'fig_hours_leaderboard']
+CHALLENGE_FIGURES = ['fig_area', 'fig_hours', 'fig_points']
+# Rendered PNGs keyed by the styled figure JSON and the render settings, so an
+# unchanged chart is never sent to Kaleido twice, across exports and restarts
+CHART_CACHE = DiskLRUCache(os.path.join('data', 'chart_cache'), max_bytes=200 * 1024 * 1024, suffix='.png')
+
+# Set once the background is ready; failures are not remembered, so a missing
+# or broken cover image is retried on the next export
+_background_path = None
+_background_lock = threading.Lock()
+
+def processed_background_path():
+    """
+    The page background (COVER_IMAGE at 50% opacity over white), prepared once
+    per process and kept on disk until the cover image changes. It is handed to
+    fpdf as a file path, so every page references one embedded image without
+    re-reading or re-hashing it. None when there is no usable cover image.
+    """
+    global _background_path
+    with _background_lock:
+        if _background_path is None:
+            _background_path = _prepare_background()
+        return _background_path
+
+def _prepare_background():
+    if not os.path.exists(COVER_IMAGE): return None
+    if os.path.exists(BACKGROUND_IMAGE) and os.path.getmtime(BACKGROUND_IMAGE) >= os.path.getmtime(COVER_IMAGE):
+        return BACKGROUND_IMAGE
+    tmp_path = None
+    try:
+        img = Image.open(COVER_IMAGE).convert("RGBA")
+        background = Image.new("RGBA", img.size, (255, 255, 255))
+        alpha = img.getchannel('A').point(lambda i: i * 0.5)
+        img.putalpha(alpha)
+        background.paste(img, (0, 0), img)
+        os.makedirs(os.path.dirname(BACKGROUND_IMAGE), exist_ok=True)
+        # A unique temp file per writer: other processes may be preparing it too
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(BACKGROUND_IMAGE), suffix=".png.tmp")
+        with os.fdopen(fd, "wb") as f:
+            background.convert("RGB").save(f, format="PNG")
+        os.replace(tmp_path, BACKGROUND_IMAGE)
+        return BACKGROUND_IMAGE
+    except Exception as e:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        st.error(f"Could not process background image: {e}")
+        return None
+
+class RenderedImage:
+    """
+    A chart rasterized once. Carries the PNG bytes and their pixel size, so
+    page layout can measure the image and then embed the same bytes.
+    """
+    def __init__(self, png):
+        self.png = png
+        # Only the PNG header is read here; the pixels are never decoded
+        self.width, self.height = Image.open(io.BytesIO(png)).size
+
+    def height_for_width(self, width_mm):
+        return width_mm * self.height / self.width
+
+    def buffer(self):
+        return io.BytesIO(self.png)
+
+def chart_cache_key(fig):
+    """Hash of everything that affects the PNG: the (already styled) figure and the render settings."""
+    return make_key(fig.to_json(), CHART_SCALE, CHART_WIDTH, CHART_HEIGHT, plotly.__version__)
+
+def render_pngs(figs):
+    """
+    Rasterizes figures to PNG bytes. Kaleido 1.x starts a Chromium for every
+    to_image call, so with plotly's batch API (plotly >= 6.1) all the figures
+    go through one Kaleido browser, one after the other. Older installs fall
+    back to one to_image call per figure.
+    """
+    options = dict(format="png", scale=CHART_SCALE, width=CHART_WIDTH, height=CHART_HEIGHT)
+    if len(figs) < 2 or not hasattr(pio, 'write_images'):
+        return [fig.to_image(**options) for fig in figs]
+    with tempfile.TemporaryDirectory() as folder:
+        paths = [os.path.join(folder, f"{i}.png") for i in range(len(figs))]
+        pio.write_images(figs, paths, **options)
+        pngs = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                pngs.append(f.read())
+        return pngs
 
 class PDFReporter(FPDF):
     """
@@ -28,9 +122,8 @@ class PDFReporter(FPDF):
         self.font_path = FONT_NAME
         self.font_loaded = False
         self._setup_fonts()
-        self.processed_background = None
-        if os.path.exists(COVER_IMAGE):
-            self._prepare_background_image()
+        self.processed_background = processed_background_path()
+        self._rendered = {} # id(fig) -> (fig, RenderedImage)
 
     def _setup_fonts(self):
         if not os.path.exists(self.font_path):
@@ -44,21 +137,6 @@ class PDFReporter(FPDF):
             st.error(f"FPDF error when adding font '{self.font_path}': {e}")
             self.font_loaded = False
 
-    def _prepare_background_image(self):
-        try:
-            img = Image.open(COVER_IMAGE).convert("RGBA")
-            background = Image.new("RGBA", img.size, (255, 255, 255))
-            alpha = img.getchannel('A').point(lambda i: i * 0.5)
-            img.putalpha(alpha)
-            background.paste(img, (0, 0), img)
-            buffer = io.BytesIO()
-            background.convert("RGB").save(buffer, format="PNG")
-            buffer.seek(0)
-            self.processed_background = buffer
-        except Exception as e:
-            st.error(f"Could not process background image: {e}")
-            self.processed_background = None
-
     def add_page(self, orientation="", format="", same=False):
         super().add_page(orientation, format, same)
         if self.processed_background:
@@ -101,6 +179,34 @@ class PDFReporter(FPDF):
         )
         return fig
 
+    def render_figures(self, figs):
+        """
+        Styles and rasterizes all the figures a report needs before any page is
+        laid out, in one Kaleido batch, so the export starts a single browser
+        rather than one per chart. Pages then only embed the ready PNGs.
+        Charts already in CHART_CACHE are not rendered at all.
+        """
+        figs = [fig for fig in figs if fig is not None and id(fig) not in self._rendered]
+        misses = []
+        for fig in figs:
+            # Styling first, so the cache key covers the Arabic layout too
+            self._style_figure_for_arabic(fig)
+            key = chart_cache_key(fig)
+            png = CHART_CACHE.get(key)
+            if png is None:
+                misses.append((fig, key))
+            else:
+                self._rendered[id(fig)] = (fig, RenderedImage(png))
+        if not misses: return
+        for (fig, key), png in zip(misses, render_pngs([fig for fig, _ in misses])):
+            self._rendered[id(fig)] = (fig, RenderedImage(png))
+            CHART_CACHE.put(key, png)
+
+    def _figure_image(self, fig):
+        if id(fig) not in self._rendered:
+            self.render_figures([fig])
+        return self._rendered[id(fig)][1]
+
     def add_cover_page(self, report_type_title):
         if not self.font_loaded: return
         self.add_page()
@@ -165,17 +271,12 @@ class PDFReporter(FPDF):
 
     def add_plot(self, fig: go.Figure, width_percent=90):
         if not self.font_loaded or not fig: return None, 0
-        styled_fig = self._style_figure_for_arabic(fig)
-        img_bytes = styled_fig.to_image(format="png", scale=2, width=800, height=500)
-        img_file = io.BytesIO(img_bytes)
-        pil_img = Image.open(img_file)
-        aspect_ratio = pil_img.height / pil_img.width
+        image = self._figure_image(fig)
         page_width = self.w - self.l_margin - self.r_margin
         img_width_mm = page_width * (width_percent / 100)
-        img_height_mm = img_width_mm * aspect_ratio
+        img_height_mm = image.height_for_width(img_width_mm)
         x_pos = (self.w - img_width_mm) / 2
-        img_file.seek(0)
-        self.image(img_file, x=x_pos, w=img_width_mm)
+        self.image(image.buffer(), x=x_pos, w=img_width_mm)
         return img_height_mm
 
     def _add_kpis_page(self, data, title="ملخص الأداء والأبطال"):
@@ -202,11 +303,9 @@ class PDFReporter(FPDF):
 
     def _add_single_plot_page(self, fig, title):
         self.add_page()
-        pil_img = Image.open(io.BytesIO(fig.to_image(format="png", scale=2, width=800, height=500)))
-        aspect_ratio = pil_img.height / pil_img.width
         page_width = self.w - self.l_margin - self.r_margin
         img_width_mm = page_width * 0.85
-        img_height_mm = img_width_mm * aspect_ratio
+        img_height_mm = self._figure_image(fig).height_for_width(img_width_mm)
         content_height = img_height_mm + 20
         top_margin = (self._get_drawable_height() - content_height) / 2 + self.t_margin
         self.set_y(top_margin)
@@ -223,10 +322,8 @@ class PDFReporter(FPDF):
         self.add_page()
         page_width = self.w - self.l_margin - self.r_margin
         img_width_mm = page_width * 0.85
-        pil_img1 = Image.open(io.BytesIO(fig1.to_image(format="png", scale=2, width=800, height=500)))
-        img_height1_mm = img_width_mm * (pil_img1.height / pil_img1.width)
-        pil_img2 = Image.open(io.BytesIO(fig2.to_image(format="png", scale=2, width=800, height=500)))
-        img_height2_mm = img_width_mm * (pil_img2.height / pil_img2.width)
+        img_height1_mm = self._figure_image(fig1).height_for_width(img_width_mm)
+        img_height2_mm = self._figure_image(fig2).height_for_width(img_width_mm)
         content_height = (img_height1_mm + img_height2_mm) + 45
         top_margin = (self._get_drawable_height() - content_height) / 2 + self.t_margin
         self.set_y(top_margin)
@@ -296,6 +393,7 @@ class PDFReporter(FPDF):
         
     def add_dashboard_report(self, data: dict):
         if not self.font_loaded: return
+        self.render_figures([data.get(key) for key in DASHBOARD_FIGURES])
         self.add_cover_page("تحليل لوحة التحكم العامة")
         self.add_group_info_page(data.get('group_stats'), data.get('periods_df'))
         self._add_kpis_page(data)
@@ -355,6 +453,7 @@ class PDFReporter(FPDF):
 
     def add_challenge_report(self, data: dict):
         if not self.font_loaded: return
+        self.render_figures([data.get(key) for key in CHALLENGE_FIGURES])
         self.add_challenge_title_page(
             title=data.get('title', ''), author=data.get('author', ''),
             period=data.get('period', ''), duration=data.get('duration', 0)
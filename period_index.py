@@ -0,0 +1,53 @@
+import bisect
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+class PeriodIndex:
+    """
+    Date -> challenge period lookup built once per run.
+    Period dates are parsed a single time and kept sorted by start date, so a
+    single date is resolved with bisect and a whole Series with np.searchsorted.
+    Challenge periods never overlap (the admin page enforces it).
+    """
+    def __init__(self, periods):
+        parsed = sorted(
+            (
+                datetime.strptime(p['start_date'], '%Y-%m-%d').date(),
+                datetime.strptime(p['end_date'], '%Y-%m-%d').date(),
+                p,
+            )
+            for p in periods
+        )
+        self._starts = [start for start, _, _ in parsed]
+        self._ends = [end for _, end, _ in parsed]
+        self._periods = [period for _, _, period in parsed]
+        self._starts_np = np.array(self._starts, dtype='datetime64[D]')
+        self._ends_np = np.array(self._ends, dtype='datetime64[D]')
+        self._ids_np = np.array([p['period_id'] for p in self._periods], dtype='int64')
+
+    def __len__(self):
+        return len(self._periods)
+
+    def find(self, day):
+        """Returns the period dict containing the given date, or None."""
+        i = bisect.bisect_right(self._starts, day) - 1
+        if i >= 0 and day <= self._ends[i]:
+            return self._periods[i]
+        return None
+
+    def assign_periods(self, dates: pd.Series) -> pd.Series:
+        """
+        Vectorized find: maps a Series of dates to their period_id.
+        Returns a nullable Int64 Series aligned on the input index, with <NA>
+        for dates that are missing or fall outside every challenge.
+        """
+        result = pd.Series(pd.NA, index=dates.index, dtype='Int64')
+        if dates.empty or not self._periods:
+            return result
+        days = pd.to_datetime(dates, errors='coerce').to_numpy(dtype='datetime64[D]')
+        positions = np.searchsorted(self._starts_np, days, side='right') - 1
+        clipped = positions.clip(min=0)
+        matched = ~np.isnat(days) & (positions >= 0) & (days <= self._ends_np[clipped])
+        result[matched] = self._ids_np[clipped[matched]]
+        return result
@@ -0,0 +1,60 @@
+import re
+import pandas as pd
+from gspread.utils import rowcol_to_a1
+
+FORM_RESPONSES_WORKSHEET = "Form Responses 1"
+
+def _column_letters(col):
+    return re.sub(r'\d+', '', rowcol_to_a1(1, col))
+
+def _column_runs(cols):
+    """Groups sorted 1-based column numbers into contiguous (first, last) runs."""
+    runs = []
+    for col in cols:
+        if runs and col == runs[-1][1] + 1:
+            runs[-1][1] = col
+        else:
+            runs.append([col, col])
+    return runs
+
+def fetch_sheet_frame(worksheet, header=None, columns=None, start_row=2, end_row=None):
+    """
+    Reads a worksheet into a DataFrame straight from the values API, without
+    building a dict per row (as get_all_records does).
+
+    header: the row-1 values, fetched when not given.
+    columns: the column names to read (all when None); adjacent columns are
+        fetched as one range and all ranges go in a single batch_get request.
+    start_row: first sheet row to read, e.g. to fetch only rows past a known offset.
+    end_row: last sheet row to read (to the end of the sheet when None).
+
+    Cells are returned as the sheet displays them (strings, '' when empty). The
+    index is sheet_row - 2, the position get_all_records would have given the row,
+    so `index + 2` is always the sheet row number.
+    """
+    if header is None:
+        header = worksheet.row_values(1)
+    cols = [i for i, name in enumerate(header, start=1) if columns is None or name in columns]
+    if not cols:
+        return pd.DataFrame()
+
+    runs = _column_runs(cols)
+    last_row = end_row or ''
+    value_ranges = worksheet.batch_get([f"{_column_letters(first)}{start_row}:{_column_letters(last)}{last_row}" for first, last in runs])
+    # The API trims trailing empty cells and rows, so ranges can come back ragged
+    n_rows = max((len(values) for values in value_ranges), default=0)
+    index = pd.RangeIndex(start_row - 2, start_row - 2 + n_rows)
+    frames = []
+    for (first, last), values in zip(runs, value_ranges):
+        width = last - first + 1
+        rows = [row + [''] * (width - len(row)) for row in values]
+        rows += [[''] * width] * (n_rows - len(rows))
+        frames.append(pd.DataFrame(rows, columns=header[first - 1:last], index=index, dtype=object))
+    return pd.concat(frames, axis=1)
+
+def hash_rows(df):
+    """Vectorized 64-bit content hash of each row (as int64, so SQLite can store it)."""
+    if df.shape[1] == 0:
+        return pd.Series(0, index=df.index, dtype='int64')
+    hashes = pd.util.hash_pandas_object(df.astype(str), index=False)
+    return pd.Series(hashes.to_numpy().view('int64'), index=df.index)
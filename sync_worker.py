@@ -0,0 +1,185 @@
+import itertools
+import os
+import random
+import threading
+import time
+import db_manager as db
+from main import run_data_update
+
+# --- Sync Lock ---
+# Only one sync may write at a time, whether it runs in this server process, in
+# another one, or from the command line. The lock is a file created atomically
+# next to the database; the running sync keeps touching it, so a lock that has
+# not been touched for STALE_LOCK_SECONDS was left behind by a crashed sync.
+LOCK_PATH = os.path.join(db.DB_FOLDER, 'sync.lock')
+STALE_LOCK_SECONDS = 10 * 60
+
+def _acquire_lock():
+    os.makedirs(db.DB_FOLDER, exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(LOCK_PATH) < STALE_LOCK_SECONDS:
+                    return False
+                os.remove(LOCK_PATH)
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(f"{os.getpid()} {time.time()}")
+        return True
+    return False
+
+def _touch_lock():
+    try:
+        os.utime(LOCK_PATH)
+    except OSError:
+        pass
+
+def _release_lock():
+    try:
+        os.remove(LOCK_PATH)
+    except FileNotFoundError:
+        pass
+
+def is_sync_running():
+    """True while any sync (in any process) holds the lock."""
+    try:
+        return time.time() - os.path.getmtime(LOCK_PATH) < STALE_LOCK_SECONDS
+    except OSError:
+        return False
+
+# --- Sync Jobs ---
+class SyncJob:
+    """One sync run: its options, status and the streamed (elapsed, message) lines."""
+    def __init__(self, job_id, full_resync, full_fetch):
+        self.job_id = job_id
+        self.full_resync = full_resync
+        self.full_fetch = full_fetch
+        self.status = 'running'
+        self.lines = []
+        self.update_log = []
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def report(self, message, elapsed):
+        """Progress callback for run_data_update (called on the worker thread)."""
+        with self._lock:
+            self.lines.append((elapsed, message))
+        _touch_lock()
+
+    def finish(self, status, update_log=None, error=None):
+        with self._lock:
+            self.status = status
+            self.update_log = list(update_log or [])
+            self.error = error
+            self.finished_at = time.time()
+
+    def snapshot(self):
+        """A consistent copy of the job state for the UI thread."""
+        with self._lock:
+            return {
+                'job_id': self.job_id, 'status': self.status, 'lines': list(self.lines),
+                'update_log': list(self.update_log), 'error': self.error,
+                'started_at': self.started_at, 'finished_at': self.finished_at,
+            }
+
+_job_ids = itertools.count(1)
+_jobs_lock = threading.Lock()
+_current_job = None
+
+def get_current_job():
+    """The most recent sync started by this process (running or finished), or None."""
+    return _current_job
+
+def _run_job(job, gc):
+    try:
+        update_log = run_data_update(gc, full_resync=job.full_resync, full_fetch=job.full_fetch, progress=job.report)
+        job.finish('done', update_log)
+    except Exception as e:
+        print(f"Sync {job.job_id} failed: {e}")
+        job.finish('failed', error=str(e))
+    finally:
+        db.close_db_connection()
+        _release_lock()
+
+def start_sync(gc, full_resync=False, full_fetch=False):
+    """
+    Starts run_data_update on a background thread and returns its SyncJob, or
+    None when another sync is already running. The caller's thread is free to
+    keep serving the dashboard; poll the job's snapshot() for progress.
+    """
+    global _current_job
+    with _jobs_lock:
+        if not _acquire_lock():
+            return None
+        job = SyncJob(next(_job_ids), full_resync, full_fetch)
+        _current_job = job
+    threading.Thread(target=_run_job, args=(job, gc), name=f"sync-{job.job_id}", daemon=True).start()
+    return job
+
+def run_sync(gc, full_resync=False, full_fetch=False, progress=None):
+    """
+    Runs one sync on the calling thread under the sync lock, for callers that
+    need the result right away. Returns the update log, or None when another
+    sync is already running.
+    """
+    if not _acquire_lock():
+        return None
+    def report(message, elapsed):
+        _touch_lock()
+        if progress:
+            progress(message, elapsed)
+    try:
+        return run_data_update(gc, full_resync=full_resync, full_fetch=full_fetch, progress=report)
+    finally:
+        _release_lock()
+
+# --- Scheduled Sync ---
+# Headless periodic syncs (see `python -m main sync`), so the dashboard never
+# pays for a sync inside a user request. Runs are spread out by a random jitter
+# and back off exponentially while the sheet or the network keeps failing.
+def sync_failed(update_log):
+    """True when run_data_update gave up (it logs errors instead of raising)."""
+    return any(line.startswith("❌") for line in update_log)
+
+def next_sync_delay(interval, failures, jitter=0.1, max_backoff=3600, rng=random):
+    """Seconds until the next run: interval * 2**failures (capped at max_backoff), +/- jitter."""
+    delay = interval
+    if failures:
+        delay = max(min(interval * 2 ** failures, max_backoff), interval)
+    return delay * (1 + rng.uniform(-jitter, jitter))
+
+def run_scheduled_sync(gc, interval, jitter=0.1, max_backoff=3600, runs=None, full_fetch=False, sleep=time.sleep, rng=random):
+    """
+    Runs incremental syncs every `interval` seconds until interrupted, or `runs`
+    times when given. A run is skipped while another sync holds the lock.
+    Returns the number of consecutive failed runs at the end.
+    """
+    failures = 0
+    completed = 0
+    while True:
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Sync starting...")
+        try:
+            update_log = run_sync(gc, full_fetch=full_fetch, progress=lambda message, elapsed: print(f"  [{elapsed:6.1f}s] {message.strip()}"))
+        except Exception as e:
+            print(f"Scheduled sync failed: {e}")
+            update_log = ["❌"]
+        finally:
+            db.close_db_connection()
+        if update_log is None:
+            print("Another sync is running; skipping this run.")
+        elif sync_failed(update_log):
+            failures += 1
+        else:
+            failures = 0
+        completed += 1
+        if runs is not None and completed >= runs:
+            return failures
+        delay = next_sync_delay(interval, failures, jitter, max_backoff, rng)
+        print(f"Next sync in {delay:.0f}s" + (f" (after {failures} failed runs)" if failures else ""))
+        sleep(delay)
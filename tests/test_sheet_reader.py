@@ -0,0 +1,139 @@
+"""
+fetch_sheet_frame and the sync watermark against a local fake of a gspread
+worksheet, so no Google credentials or network are needed.
+"""
+import pytest
+from gspread.utils import a1_range_to_grid_range
+
+import main
+from sheet_reader import _column_runs, fetch_sheet_frame
+
+HEADER = ['Timestamp', 'اسمك', 'البريد', 'تاريخ القراءة', 'الإنجازات']
+
+class FakeWorksheet:
+    """Serves row_values and batch_get from a list of rows, trimming like the values API."""
+    def __init__(self, rows):
+        self.rows = rows
+        self.ranges = []
+
+    def row_values(self, row):
+        return _trim(list(self.rows[row - 1]))
+
+    def batch_get(self, ranges):
+        self.ranges.append(list(ranges))
+        value_ranges = []
+        for a1 in ranges:
+            grid = a1_range_to_grid_range(a1)
+            first_col, last_col = grid['startColumnIndex'], grid['endColumnIndex']
+            rows = self.rows[grid['startRowIndex']:grid.get('endRowIndex')]
+            values = [_trim(list(row[first_col:last_col])) for row in rows]
+            while values and not values[-1]:
+                values.pop()
+            value_ranges.append(values)
+        return value_ranges
+
+def _trim(values):
+    """The API drops trailing empty cells."""
+    while values and values[-1] == '':
+        values.pop()
+    return values
+
+def response(i, name='أحمد', achievements=''):
+    return [f'ts{i:03d}', name, f'm{i}@example.com', '2024-03-05', achievements]
+
+@pytest.fixture
+def sheet():
+    return FakeWorksheet([HEADER] + [response(i) for i in range(4)])
+
+def test_column_runs_groups_adjacent_columns():
+    assert _column_runs([1, 2, 4, 6, 7, 8]) == [[1, 2], [4, 4], [6, 8]]
+    assert _column_runs([]) == []
+
+def test_reads_all_columns_with_sheet_row_index(sheet):
+    df = fetch_sheet_frame(sheet)
+    assert list(df.columns) == HEADER
+    assert df.index.tolist() == [0, 1, 2, 3]
+    # index + 2 is the sheet row number
+    assert df.loc[2, 'Timestamp'] == sheet.rows[2 + 1][0]
+
+def test_pads_ragged_and_trimmed_rows(sheet):
+    sheet.rows[2][3:] = ['', '']          # trailing empty cells are trimmed
+    sheet.rows[4][1:] = ['', '', '', '']  # last row: only the Timestamp is left
+    df = fetch_sheet_frame(sheet, columns=['Timestamp', 'اسمك', 'تاريخ القراءة', 'الإنجازات'])
+    assert len(df) == 4
+    assert df.loc[1].tolist() == ['ts001', 'أحمد', '', '']
+    # The second range ends a row before the first one: its missing row is padded
+    assert df.loc[3].tolist() == ['ts003', '', '', '']
+
+def test_selected_columns_in_one_batch_get(sheet):
+    df = fetch_sheet_frame(sheet, HEADER, columns=['Timestamp', 'اسمك', 'الإنجازات'])
+    assert list(df.columns) == ['Timestamp', 'اسمك', 'الإنجازات']
+    assert sheet.ranges == [['A2:B', 'E2:E']]
+
+def test_start_row_keeps_the_index_mapping(sheet):
+    df = fetch_sheet_frame(sheet, HEADER, start_row=4)
+    assert df.index.tolist() == [2, 3]
+    assert df['Timestamp'].tolist() == ['ts002', 'ts003']
+    assert sheet.ranges == [['A4:E']]
+
+def test_end_row_bounds_the_range(sheet):
+    df = fetch_sheet_frame(sheet, HEADER, start_row=3, end_row=4)
+    assert df.index.tolist() == [1, 2]
+    assert df['Timestamp'].tolist() == ['ts001', 'ts002']
+    assert sheet.ranges == [['A3:E4']]
+
+def test_empty_results(sheet):
+    assert fetch_sheet_frame(sheet, HEADER, columns=['غير موجود']).empty
+    del sheet.rows[1:]
+    df = fetch_sheet_frame(sheet, HEADER)
+    assert df.empty and list(df.columns) == HEADER
+
+# --- Sync watermark ---
+@pytest.fixture
+def settings(monkeypatch):
+    values = {}
+    monkeypatch.setattr(main.db, 'get_setting', values.get)
+    monkeypatch.setattr(main.db, 'set_setting', lambda key, value: values.__setitem__(key, str(value)))
+    return values
+
+def test_watermark_round_trip(sheet, settings):
+    assert main.fetch_rows_above_watermark(sheet, HEADER) is None  # never synced
+    main.save_sync_watermark(fetch_sheet_frame(sheet, HEADER))
+    assert settings == {main.SYNC_ROW_COUNT_KEY: '4', main.SYNC_LAST_TIMESTAMP_KEY: 'ts003'}
+
+    assert main.fetch_rows_above_watermark(sheet, HEADER).empty
+    sheet.rows += [response(4), response(5)]
+    new_rows = main.fetch_rows_above_watermark(sheet, HEADER)
+    assert new_rows['Timestamp'].tolist() == ['ts004', 'ts005']
+    assert new_rows.index.tolist() == [4, 5]
+    # Only the anchor row and the rows past it were read
+    assert {a1_range_to_grid_range(a1)['startRowIndex'] for a1 in sheet.ranges[-1]} == {4}
+
+@pytest.mark.parametrize('change', ['delete', 'insert', 'edit_anchor', 'truncate'])
+def test_watermark_falls_back_to_full_fetch(sheet, settings, change):
+    main.save_sync_watermark(fetch_sheet_frame(sheet, HEADER))
+    sheet.rows.append(response(4))
+    if change == 'delete':
+        del sheet.rows[2]
+    elif change == 'insert':
+        sheet.rows.insert(2, response(9))
+    elif change == 'edit_anchor':
+        sheet.rows[4][0] = 'ts003 (edited)'
+    else:
+        del sheet.rows[3:]
+    assert main.fetch_rows_above_watermark(sheet, HEADER) is None
+
+def test_rejected_rows_are_retried(sheet, settings):
+    assert main.fetch_rows_to_retry(sheet, HEADER).empty
+    main.save_rows_to_retry([({'timestamp': 'ts001', 'sheet_row': 3}, 'عضو غير معروف'),
+                             ({'timestamp': 'ts003', 'sheet_row': 5}, 'تاريخ قراءة غير صالح'),
+                             ({'timestamp': '', 'sheet_row': 4}, 'لا يوجد Timestamp')])
+    retry_df = main.fetch_rows_to_retry(sheet, HEADER)
+    assert retry_df['Timestamp'].tolist() == ['ts001', 'ts003']
+    assert retry_df.index.tolist() == [1, 3]
+    # One request spanning the rejected rows only
+    spans = [a1_range_to_grid_range(a1) for a1 in sheet.ranges[-1]]
+    assert {(span['startRowIndex'], span['endRowIndex']) for span in spans} == {(2, 5)}
+
+    del sheet.rows[1]
+    assert main.fetch_rows_to_retry(sheet, HEADER) is None  # moved: full fetch
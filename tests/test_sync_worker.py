@@ -0,0 +1,143 @@
+"""
+The scheduled sync (sync_worker.run_scheduled_sync and `python -m main sync`)
+against a fake gspread client, a temporary database and injected sleep/rng.
+"""
+import os
+import sys
+import time
+import types
+
+import pytest
+
+import database_setup
+import db_manager as db
+import main
+import sync_worker
+from test_sheet_reader import HEADER, FakeWorksheet, response
+
+RULES = dict(
+    minutes_per_point_common=10, minutes_per_point_other=5,
+    quote_common_book_points=3, quote_other_book_points=1,
+    finish_common_book_points=50, finish_other_book_points=25, attend_discussion_points=25,
+)
+
+class FakeClient:
+    """gspread.Client stand-in: serves one worksheet, or fails the next `failures` opens."""
+    def __init__(self, worksheet, failures=0):
+        self.sheet = worksheet
+        self.failures = failures
+        self.opens = 0
+
+    def open_by_url(self, url):
+        self.opens += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("sheet unavailable")
+        return self
+
+    def worksheet(self, name):
+        return self.sheet
+
+class NoJitter:
+    def uniform(self, low, high):
+        return 0.0
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A fresh database in tmp_path, set up with one member and one challenge."""
+    folder = str(tmp_path)
+    path = os.path.join(folder, db.DB_NAME)
+    for module in (db, database_setup):
+        monkeypatch.setattr(module, 'DB_FOLDER', folder)
+        monkeypatch.setattr(module, 'DB_PATH', path)
+    monkeypatch.setattr(sync_worker, 'LOCK_PATH', os.path.join(folder, 'sync.lock'))
+    database_setup.create_database()
+    db.add_members(['أحمد'])
+    ok, message = db.add_book_and_challenge(
+        {'title': 'كتاب', 'author': 'مؤلف', 'year': 2024},
+        {'start_date': '2024-03-01', 'end_date': '2024-03-31'}, RULES)
+    assert ok, message
+    db.set_setting('spreadsheet_url', 'https://example.com/sheet')
+    yield folder
+    db.close_db_connection()
+
+@pytest.fixture
+def client():
+    return FakeClient(FakeWorksheet([HEADER] + [response(i) for i in range(3)]))
+
+def logged_rows():
+    return db.get_db_connection().execute("SELECT COUNT(*) FROM ReadingLogs").fetchone()[0]
+
+# --- Delays ---
+def test_next_sync_delay_jitter():
+    highest = types.SimpleNamespace(uniform=lambda low, high: high)
+    lowest = types.SimpleNamespace(uniform=lambda low, high: low)
+    assert sync_worker.next_sync_delay(300, 0, jitter=0.1, rng=highest) == pytest.approx(330)
+    assert sync_worker.next_sync_delay(300, 0, jitter=0.1, rng=lowest) == pytest.approx(270)
+    assert sync_worker.next_sync_delay(300, 0, jitter=0, rng=highest) == 300
+
+def test_backoff_doubles_up_to_max_backoff():
+    delays = [sync_worker.next_sync_delay(60, failures, max_backoff=300, rng=NoJitter()) for failures in range(5)]
+    assert delays == [60, 120, 240, 300, 300]
+
+# --- Scheduled runs ---
+def test_failed_runs_back_off(database, client):
+    client.failures = 10
+    delays = []
+    failures = sync_worker.run_scheduled_sync(client, 60, max_backoff=300, runs=4, sleep=delays.append, rng=NoJitter())
+    assert failures == 4
+    assert delays == [120, 240, 300]
+
+def test_backoff_resets_after_a_success(database, client):
+    client.failures = 2
+    delays = []
+    failures = sync_worker.run_scheduled_sync(client, 60, max_backoff=300, runs=4, sleep=delays.append, rng=NoJitter())
+    assert failures == 0
+    assert delays == [120, 240, 60]
+    assert logged_rows() == 3
+    assert not os.path.exists(sync_worker.LOCK_PATH)
+
+def test_new_rows_are_picked_up_between_runs(database, client):
+    def sleep(delay):
+        client.sheet.rows.append(response(len(client.sheet.rows) - 1))
+    sync_worker.run_scheduled_sync(client, 60, runs=3, sleep=sleep, rng=NoJitter())
+    assert logged_rows() == 5
+
+def test_skips_while_the_lock_is_held(database, client):
+    with open(sync_worker.LOCK_PATH, 'w') as f:
+        f.write("another sync")
+    delays = []
+    failures = sync_worker.run_scheduled_sync(client, 60, runs=2, sleep=delays.append, rng=NoJitter())
+    assert failures == 0 and delays == [60]
+    assert client.opens == 0
+    assert os.path.exists(sync_worker.LOCK_PATH)  # still the other sync's
+
+def test_stale_lock_is_taken_over(database, client):
+    with open(sync_worker.LOCK_PATH, 'w') as f:
+        f.write("crashed sync")
+    stale = time.time() - sync_worker.STALE_LOCK_SECONDS - 1
+    os.utime(sync_worker.LOCK_PATH, (stale, stale))
+    sync_worker.run_scheduled_sync(client, 60, runs=1, rng=NoJitter())
+    assert client.opens == 1 and logged_rows() == 3
+
+# --- Command line ---
+@pytest.fixture
+def cli(database, client, monkeypatch):
+    """Points `python -m main sync` at the fake client, with stored credentials present."""
+    auth = types.SimpleNamespace(TOKEN_FILE='token.json', load_stored_credentials=lambda: object())
+    monkeypatch.setitem(sys.modules, 'auth_manager', auth)
+    monkeypatch.setattr(main.gspread, 'authorize', lambda creds: client)
+    return auth
+
+def test_cli_once_exit_codes(cli, client):
+    assert main.main_cli(['sync', '--once']) == 0
+    assert logged_rows() == 3
+    client.failures = 1
+    assert main.main_cli(['sync', '--once']) == 1
+
+def test_cli_without_credentials(cli, client):
+    cli.load_stored_credentials = lambda: None
+    with pytest.raises(SystemExit) as exit_info:
+        main.main_cli(['sync', '--once'])
+    assert exit_info.value.code == 1
+    assert client.opens == 0